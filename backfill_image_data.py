@@ -0,0 +1,103 @@
+"""
+Moves the inline image_data of existing operations documents to blob storage,
+leaving the same {"url", "sha256", "size", "width", "height", "content_type"}
+reference that IMAGE_DATA_STORAGE=blob writes for new documents.
+
+    python backfill_image_data.py --dry-run
+    python backfill_image_data.py --min-bytes 100000 --batch-size 200
+
+Uses MONGO_URI / MONGO_DB_NAME and the BLOB_* settings of the app. Documents are
+walked in _id order one batch at a time, so the tool can be stopped and re-run;
+converted documents no longer match and identical frames are uploaded once.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+import config  # noqa: F401  (loads .env)
+from migration import offload_image_payloads
+from upload_image import blob_service
+
+
+def oversized_filter(min_bytes: int) -> dict:
+    query = {"image_data": {"$type": "string"}}
+    if min_bytes:
+        query["$expr"] = {"$gt": [{"$strLenBytes": "$image_data"}, min_bytes]}
+    return query
+
+
+async def backfill(collection, batch_size: int, min_bytes: int = 0, limit: int = None,
+                   concurrency: int = 8, dry_run: bool = False) -> dict:
+    """
+    :return: {"documents", "converted", "skipped", "inline_bytes", "moved_bytes", "seconds"}: inline_bytes
+             is the base64 held by every matching document, moved_bytes the part taken out of MongoDB.
+    """
+    stats = {"documents": 0, "converted": 0, "skipped": 0, "inline_bytes": 0, "moved_bytes": 0}
+    start = time.perf_counter()
+    last_id = None
+    while limit is None or stats["documents"] < limit:
+        query = oversized_filter(min_bytes)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        size = batch_size if limit is None else min(batch_size, limit - stats["documents"])
+        documents = await collection.find(query, {"image_data": 1}).sort("_id", 1).limit(size).to_list(length=size)
+        if not documents:
+            break
+        last_id = documents[-1]["_id"]
+        stats["documents"] += len(documents)
+        stats["inline_bytes"] += sum(len(document["image_data"]) for document in documents)
+
+        if dry_run:
+            continue
+        images = await offload_image_payloads([document["image_data"] for document in documents], concurrency)
+        updates = [
+            UpdateOne({"_id": document["_id"]}, {"$set": {"image": image}, "$unset": {"image_data": ""}})
+            for document, image in zip(documents, images) if image is not None
+        ]
+        if updates:
+            await collection.bulk_write(updates, ordered=False)
+        stats["converted"] += len(updates)
+        stats["skipped"] += len(documents) - len(updates)
+        stats["moved_bytes"] += sum(len(document["image_data"])
+                                    for document, image in zip(documents, images) if image is not None)
+        print(f"{stats['documents']} documents, {stats['converted']} converted", flush=True)
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+async def run(args):
+    client = AsyncIOMotorClient(os.getenv("MONGO_URI"))
+    try:
+        collection = client[os.getenv("MONGO_DB_NAME")][args.collection]
+        stats = await backfill(collection, args.batch_size, args.min_bytes, args.limit,
+                               args.concurrency, args.dry_run)
+    finally:
+        client.close()
+        await blob_service.close()
+
+    if args.dry_run:
+        print(f"{stats['documents']} documents hold {stats['inline_bytes'] / 1e6:.1f} MB of inline image_data")
+    else:
+        print(f"Moved {stats['moved_bytes'] / 1e6:.1f} MB of image_data out of MongoDB: {stats['converted']} "
+              f"documents converted, {stats['skipped']} unreadable kept inline ({stats['seconds']} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="operations")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--min-bytes", type=int, default=0,
+                        help="only convert documents whose image_data is longer than this")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many documents")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel blob uploads")
+    parser.add_argument("--dry-run", action="store_true", help="count what would be converted, write nothing")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Parity and latency of the CPU inference backends against the PyTorch model.
+
+Runs the reference weights (ultralytics/PyTorch by default) and each candidate
+(e.g. the exported .onnx, .int8.onnx or OpenVINO folder) on the same frames,
+matches boxes by IoU and reports recall, precision, box IoU and confidence drift
+next to per-frame latency.
+
+    python benchmarks/bench_backends.py --images dataset/valid/images \\
+        --candidates YOLOv8-str-flower-model.onnx YOLOv8-str-flower-model.int8.onnx
+
+Exits with status 1 when a candidate misses --min-recall or drifts more than
+--max-conf-diff (loosen both for INT8 models).
+"""
+import argparse
+import glob
+import itertools
+import os
+import sys
+
+import cv2
+import numpy
+
+from common import measure, synthetic_field  # noqa: E402
+
+from inference_backends import load_model  # noqa: E402
+from postprocess import box_iou  # noqa: E402
+from yolo_method import raw_detections  # noqa: E402
+
+
+def match_detections(reference, candidate, iou_threshold: float) -> dict:
+    """Greedily pairs every reference box with the best unmatched candidate box of the same class."""
+    ref_boxes, ref_conf, ref_cls = reference
+    boxes, conf, cls = candidate
+    matched, ious, conf_diffs = 0, [], []
+    if len(ref_boxes) and len(boxes):
+        overlap = box_iou(ref_boxes, boxes)
+        overlap[ref_cls[:, None] != cls[None, :]] = 0
+        for i in numpy.argsort(-ref_conf):
+            j = int(overlap[i].argmax())
+            if overlap[i, j] >= iou_threshold:
+                matched += 1
+                ious.append(overlap[i, j])
+                conf_diffs.append(abs(float(ref_conf[i]) - float(conf[j])))
+                overlap[:, j] = 0
+    return {"reference": len(ref_boxes), "candidate": len(boxes), "matched": matched,
+            "ious": ious, "conf_diffs": conf_diffs}
+
+
+def load_frames(folder: str, limit: int):
+    if folder:
+        paths = sorted(glob.glob(os.path.join(folder, "*.jpg")) + glob.glob(os.path.join(folder, "*.png")))[:limit]
+        frames = [frame for frame in (cv2.imread(path) for path in paths) if frame is not None]
+        if not frames:
+            raise SystemExit(f"No readable .jpg/.png images in {folder}")
+        return frames
+    # without real images parity is only checked on synthetic frames (few or no detections)
+    return [synthetic_field(1280, 720, 20, seed)[0] for seed in range(limit)]
+
+
+def detect(model, frame, conf: float):
+    return raw_detections(model(frame, conf=conf, verbose=False)[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reference", default="YOLOv8-str-flower-model.pt")
+    parser.add_argument("--candidates", nargs="+", required=True)
+    parser.add_argument("--images", help="Folder of test frames (synthetic frames when omitted)")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--conf", type=float, default=0.3)
+    parser.add_argument("--match-iou", type=float, default=0.5)
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--max-conf-diff", type=float, default=0.05, help="Mean absolute confidence drift")
+    parser.add_argument("--runs", type=int, default=20, help="Timed calls per model")
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.limit)
+    reference = load_model(args.reference)
+    ref_detections = [detect(reference, frame, args.conf) for frame in frames]
+
+    def latency(model):
+        frame_cycle = itertools.cycle(frames)
+        return measure(lambda: model(next(frame_cycle), conf=args.conf, verbose=False), args.runs)
+
+    ref_latency = latency(reference)
+    print(f"{len(frames)} frames, reference {args.reference}: p50 {ref_latency['p50_ms']:.1f} ms, "
+          f"p95 {ref_latency['p95_ms']:.1f} ms, {sum(len(d[0]) for d in ref_detections)} boxes")
+    print(f"{'candidate':<44} {'recall':>7} {'prec.':>7} {'IoU':>6} {'dconf':>7} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8}")
+
+    ok = True
+    for path in args.candidates:
+        model = load_model(path)
+        totals = {"reference": 0, "candidate": 0, "matched": 0, "ious": [], "conf_diffs": []}
+        for frame, ref in zip(frames, ref_detections):
+            result = match_detections(ref, detect(model, frame, args.conf), args.match_iou)
+            for key in totals:
+                totals[key] += result[key]
+
+        recall = totals["matched"] / totals["reference"] if totals["reference"] else 1.0
+        precision = totals["matched"] / totals["candidate"] if totals["candidate"] else 1.0
+        mean_iou = float(numpy.mean(totals["ious"])) if totals["ious"] else float(not totals["reference"])
+        conf_diff = float(numpy.mean(totals["conf_diffs"])) if totals["conf_diffs"] else 0.0
+        timing = latency(model)
+        passed = recall >= args.min_recall and conf_diff <= args.max_conf_diff
+        ok = ok and passed
+
+        print(f"{os.path.basename(os.path.normpath(path)):<44} {recall:>7.3f} {precision:>7.3f} {mean_iou:>6.3f} "
+              f"{conf_diff:>7.4f} {timing['p50_ms']:>8.1f} {timing['p95_ms']:>8.1f} "
+              f"{ref_latency['p50_ms'] / max(timing['p50_ms'], 1e-6):>7.1f}x{'' if passed else '  PARITY FAILED'}")
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
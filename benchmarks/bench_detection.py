@@ -0,0 +1,107 @@
+"""
+Function-level benchmarks of the detection pipelines.
+
+Times find_flower_cv, detect_flowers_and_simplify and find_flower_yolo on synthetic
+strawberry-field frames at several sizes and flower densities. YOLO runs against
+a stub model (see common.StubModel) so the suite works offline on CPU and measures
+everything around the network: decoding, post-processing, drawing and encoding.
+
+    python benchmarks/bench_detection.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_detection.py --compare benchmarks/baseline.json --threshold 0.15
+
+Exits with status 1 when --compare finds a regression above the threshold.
+"""
+import argparse
+import base64
+import os
+import sys
+from contextlib import contextmanager
+
+# calls are sequential, so don't let the scheduler wait for batch partners
+os.environ.setdefault("YOLO_MAX_WAIT_MS", "0")
+
+from common import (compare_baseline, encode_jpeg, install_stub_model, measure,  # noqa: E402
+                    print_table, save_baseline, synthetic_field)
+
+import preprocess  # noqa: E402
+from openCV_method import detect_flowers_and_simplify, find_flower_cv  # noqa: E402
+from yolo_method import find_flower_yolo  # noqa: E402
+
+
+@contextmanager
+def reduced_decode(mode: str):
+    previous, preprocess.REDUCED_DECODE = preprocess.REDUCED_DECODE, mode
+    try:
+        yield
+    finally:
+        preprocess.REDUCED_DECODE = previous
+
+
+def parse_sizes(value: str):
+    return [tuple(int(v) for v in size.split("x")) for size in value.split(",")]
+
+
+def run_suite(sizes, densities, runs: int, warmup: int, only: str = None) -> dict:
+    results = {}
+
+    def add(case: str, fn):
+        if only and only not in case:
+            return
+        results[case] = measure(fn, runs, warmup)
+        r = results[case]
+        print(f"{case:<48} p50 {r['p50_ms']:>8.2f} ms  p95 {r['p95_ms']:>8.2f} ms", file=sys.stderr)
+
+    for width, height in sizes:
+        for density in densities:
+            image, _ = synthetic_field(width, height, density)
+            b64img = base64.b64encode(encode_jpeg(image)).decode()
+            suffix = f"{width}x{height} d={density}"
+
+            for output in ("png", "coords"):
+                add(f"cv.find_flower_cv[{output}] {suffix}", lambda output=output: find_flower_cv(b64img, output=output))
+            add(f"cv.detect_flowers_and_simplify {suffix}", lambda: detect_flowers_and_simplify(image))
+            # same call with the JPEG decoded at full resolution (REDUCED_DECODE=off)
+            with reduced_decode("off"):
+                add(f"cv.find_flower_cv[coords,full-decode] {suffix}", lambda: find_flower_cv(b64img, output="coords"))
+
+            # the stub returns `density` boxes per frame
+            install_stub_model(detections=density)
+            for output in ("png", "coords"):
+                add(f"yolo.find_flower_yolo[{output}] {suffix}",
+                    lambda output=output: find_flower_yolo(b64img, output=output))
+            with reduced_decode("off"):
+                add(f"yolo.find_flower_yolo[coords,full-decode] {suffix}",
+                    lambda: find_flower_yolo(b64img, output="coords"))
+            # HSV pre-pass first: empty frames skip the model, others only send candidate regions
+            add(f"yolo.find_flower_yolo[coords,cascade] {suffix}",
+                lambda: find_flower_yolo(b64img, output="coords", cascade=True))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="640x480,1280x720,1920x1080,4032x3024",
+                        help="Comma separated WIDTHxHEIGHT frame sizes")
+    parser.add_argument("--densities", default="0,10,50", help="Comma separated flowers per frame")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--only", help="Only run cases whose name contains this text")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown, 0.15 = 15%%")
+    parser.add_argument("--metric", default="p50_ms", help="Metric compared with the baseline")
+    args = parser.parse_args()
+
+    results = run_suite(parse_sizes(args.sizes), [int(d) for d in args.densities.split(",")],
+                        args.runs, args.warmup, args.only)
+    print_table(results)
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare and not compare_baseline(args.compare, results, args.threshold, args.metric):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Compares the per-request cost of the YOLO response formats.
+
+Everything before rendering (decode, inference, coordinate extraction) is identical
+for every format, so this times render_detections plus JSON serialization on a
+synthetic frame with synthetic boxes and reports latency and response size.
+
+    python benchmarks/bench_response_modes.py --width 1920 --height 1080 --boxes 50
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from yolo_method import OUTPUT_FORMATS, render_detections  # noqa: E402
+
+
+def synthetic_detections(width: int, height: int, count: int, seed: int = 0):
+    rng = numpy.random.default_rng(seed)
+    image = rng.integers(0, 256, (height, width, 3), dtype=numpy.uint8)
+    size = rng.uniform(10, 60, (count, 2))
+    top_left = rng.uniform(0, 1, (count, 2)) * ([width, height] - size)
+    boxes = numpy.hstack([top_left, top_left + size]).astype(numpy.float32)
+    confidences = rng.uniform(0.3, 1.0, count).astype(numpy.float32)
+    coords = [
+        {"x": round(float((b[0] + b[2]) / 2 / width), 4),
+         "y": round(float((b[1] + b[3]) / 2 / height), 4),
+         "confidence": round(float(c), 2)}
+        for b, c in zip(boxes, confidences)
+    ]
+    return image, boxes, confidences, coords
+
+
+def bench(output: str, image, boxes, confidences, coords, quality: int, runs: int) -> dict:
+    timings = []
+    size = 0
+    for _ in range(runs):
+        frame = image.copy()
+        start = time.perf_counter()
+        result = render_detections(frame, boxes, confidences, coords, output, quality)
+        if output == "binary":
+            body = result.pop("image_bytes")
+            size = len(body) + len(json.dumps(result["imageResult"]))
+        else:
+            size = len(json.dumps(result))
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "format": output,
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": statistics.median(timings),
+        "bytes": size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--boxes", type=int, default=50)
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    image, boxes, confidences, coords = synthetic_detections(args.width, args.height, args.boxes)
+    rows = [bench(f, image, boxes, confidences, coords, args.quality, args.runs) for f in OUTPUT_FORMATS]
+    baseline = next(r for r in rows if r["format"] == "png")
+
+    print(f"{args.width}x{args.height}, {args.boxes} boxes, quality {args.quality}, {args.runs} runs")
+    print(f"{'format':<8} {'mean ms':>9} {'p50 ms':>9} {'bytes':>10} {'speedup':>8} {'smaller':>8}")
+    for r in rows:
+        print(f"{r['format']:<8} {r['mean_ms']:>9.2f} {r['p50_ms']:>9.2f} {r['bytes']:>10} "
+              f"{baseline['mean_ms'] / max(r['mean_ms'], 1e-6):>7.0f}x {baseline['bytes'] / r['bytes']:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
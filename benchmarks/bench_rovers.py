@@ -0,0 +1,132 @@
+"""
+Rover registration throughput: POST /rovers/ one rover per request vs /rovers/bulk.
+
+Drives main.app in-process (httpx ASGI transport) against the PostgreSQL database
+configured in .env (DB_CONNECTION), so it measures the real inserts. Rovers get
+initial_ids from --id-offset upwards and are deleted again afterwards unless --keep.
+
+    python benchmarks/bench_rovers.py --rovers 2000 --concurrency 8 --batch-size 500
+    python benchmarks/bench_rovers.py --rovers 10000 --only bulk
+
+Reports rovers per second per case next to the usual per-request latencies.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import time
+
+import httpx
+
+from common import PeakRSS, print_table, summarize  # noqa: E402
+
+from main import app, db_manager  # noqa: E402
+
+
+def rover_rows(count: int, offset: int):
+    return [{"initial_id": offset + i, "rover_status": 1, "user_id": 1} for i in range(count)]
+
+
+def encode_bulk(rovers, body_format: str):
+    """:return: (body, content type) of one /rovers/bulk request."""
+    if body_format == "ndjson":
+        return "\n".join(json.dumps(rover) for rover in rovers).encode(), "application/x-ndjson"
+    if body_format == "csv":
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=["initial_id", "rover_status", "user_id"])
+        writer.writeheader()
+        writer.writerows(rovers)
+        return out.getvalue().encode(), "text/csv"
+    return json.dumps(rovers).encode(), "application/json"
+
+
+async def run_requests(client: httpx.AsyncClient, requests, concurrency: int, rovers_total: int):
+    latencies, rover_ids = [], []
+    pending = iter(requests)
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for request in pending:
+            start = time.perf_counter()
+            response = await client.request(**request)
+            if response.status_code >= 400:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            body = response.json()
+            rover_ids.extend(rover["rover_id"] for rover in body.get("rovers", [body]))
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    result = summarize(latencies, elapsed, rss.peak_mb, concurrency=concurrency, errors=errors,
+                       rovers_per_second=round(len(rover_ids) / elapsed, 1) if elapsed > 0 else 0.0)
+    if len(rover_ids) != rovers_total:
+        print(f"warning: {len(rover_ids)} of {rovers_total} rovers registered", file=sys.stderr)
+    return result, rover_ids
+
+
+def delete_rovers(rover_ids):
+    with db_manager.postgres.connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM rovers WHERE rover_id = ANY(%s);", (rover_ids,))
+        connection.commit()
+
+
+async def run_bench(args) -> dict:
+    cases = {"single POST /rovers/": None}
+    for body_format in ("json", "ndjson", "csv"):
+        cases[f"bulk POST /rovers/bulk [{body_format}, {args.batch_size}/request]"] = body_format
+
+    # ASGITransport doesn't send lifespan events, so run the app's startup/shutdown hooks here
+    await app.router.startup()
+    results = {}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                     timeout=300) as client:
+            for index, (name, body_format) in enumerate(cases.items()):
+                if args.only and args.only not in name:
+                    continue
+                rovers = rover_rows(args.rovers, args.id_offset + index * args.rovers)
+                if body_format is None:
+                    requests = [dict(method="POST", url="/rovers/", json=rover) for rover in rovers]
+                else:
+                    requests = []
+                    for start in range(0, len(rovers), args.batch_size):
+                        body, content_type = encode_bulk(rovers[start:start + args.batch_size], body_format)
+                        requests.append(dict(method="POST", url="/rovers/bulk", content=body,
+                                             headers={"Content-Type": content_type}))
+
+                results[name], rover_ids = await run_requests(client, requests, args.concurrency, args.rovers)
+                print(f"{name:<48} {results[name]['rovers_per_second']:>10.1f} rovers/s", file=sys.stderr)
+                if not args.keep and rover_ids:
+                    await asyncio.to_thread(delete_rovers, rover_ids)
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rovers", type=int, default=2000, help="Rovers registered per case")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500, help="Rovers per /rovers/bulk request")
+    parser.add_argument("--id-offset", type=int, default=900_000_000, help="First initial_id used")
+    parser.add_argument("--only", help="Only run cases whose name contains this text")
+    parser.add_argument("--keep", action="store_true", help="Don't delete the registered rovers")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_bench(args))
+    print_table(results)
+    print(f"\n{'case':<48} {'rovers/s':>10}")
+    for name, result in results.items():
+        print(f"{name:<48} {result['rovers_per_second']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
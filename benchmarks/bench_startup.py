@@ -0,0 +1,146 @@
+"""
+Cold-start benchmark: import time of main, startup hooks, time until /ready and
+latency of the first detection request, per STARTUP_WARMUP mode.
+
+Every run is a fresh Python process, so nothing is cached between runs.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --stub --importtime
+    python benchmarks/bench_startup.py --compare benchmarks/startup_baseline.json
+
+With --stub the stub model replaces the real weights (offline runs; warm-up then
+costs nothing). Exits with status 1 when --compare finds a regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+MODES = ("eager", "background", "lazy")
+
+
+def child(stub: bool, ready_timeout: float):
+    """Runs in the measured process and prints its timings as one JSON line."""
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    import main
+    import_ms = (time.perf_counter() - start) * 1000
+
+    import httpx
+    import psutil
+    from common import encode_jpeg, install_stub_model, synthetic_field
+
+    if stub:
+        install_stub_model()
+    jpeg = encode_jpeg(synthetic_field(640, 480, 10)[0])
+
+    async def run() -> dict:
+        start = time.perf_counter()
+        await main.app.router.startup()
+        startup_ms = (time.perf_counter() - start) * 1000
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+                while (await client.get("/ready")).status_code != 200:
+                    if time.perf_counter() - start > ready_timeout:
+                        # e.g. eager warm-up without the model weights (use --stub offline)
+                        raise SystemExit(f"/ready not answering 200 after {ready_timeout:.0f}s")
+                    await asyncio.sleep(0.01)
+                ready_ms = (time.perf_counter() - start) * 1000
+
+                request_start = time.perf_counter()
+                response = await client.post("/find-flower-yolo/upload?format=coords", content=jpeg,
+                                             headers={"Content-Type": "application/octet-stream"})
+                first_request_ms = (time.perf_counter() - request_start) * 1000
+        finally:
+            await main.app.router.shutdown()
+        return {"startup_ms": startup_ms, "ready_ms": ready_ms, "first_request_ms": first_request_ms,
+                "first_request_status": response.status_code}
+
+    timings = asyncio.run(run())
+    print(json.dumps({"import_ms": import_ms, **timings, "rss_mb": psutil.Process().memory_info().rss / 2 ** 20}))
+
+
+def run_child(mode: str, stub: bool, ready_timeout: float) -> dict:
+    env = {**os.environ, "STARTUP_WARMUP": mode, "RESULT_CACHE_MAX_MB": "0"}
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--ready-timeout", str(ready_timeout)]
+    command += ["--stub"] if stub else []
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise SystemExit(f"STARTUP_WARMUP={mode} run failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def import_profile(top: int):
+    """Slowest direct imports of main according to python -X importtime."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                               cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        # nesting is shown as two spaces of indentation per level, main's own imports are level 1
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth == 1:
+            rows.append((int(cumulative), name.strip()))
+    print("\nSlowest imports of main (python -X importtime, cumulative):")
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:>9.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--stub", action="store_true", help="Use the stub model instead of the configured weights")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma separated STARTUP_WARMUP modes")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per mode")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports")
+    parser.add_argument("--ready-timeout", type=float, default=120,
+                        help="Seconds a run may take to answer /ready with 200 before it fails")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--metric", default="p50_ms", help="Metric compared with the baseline")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.stub, args.ready_timeout)
+        return
+
+    from common import compare_baseline, print_table, save_baseline, summarize, use_offline_services
+
+    # inherited by the measured processes, like common's MIGRATION_SCHEDULER default
+    use_offline_services()
+
+    samples = {}
+    for mode in args.modes.split(","):
+        for _ in range(args.runs):
+            run = run_child(mode, args.stub, args.ready_timeout)
+            if run["first_request_status"] != 200:
+                print(f"warning: first request with STARTUP_WARMUP={mode} answered {run['first_request_status']}",
+                      file=sys.stderr)
+            for metric, case in (("import_ms", "import main"), ("startup_ms", f"startup hooks [{mode}]"),
+                                 ("ready_ms", f"startup until /ready [{mode}]"),
+                                 ("first_request_ms", f"first request [{mode}]")):
+                samples.setdefault(case, ([], []))
+                samples[case][0].append(run[metric])
+                samples[case][1].append(run["rss_mb"])
+
+    results = {case: summarize(values, 0, round(max(rss), 1)) for case, (values, rss) in samples.items()}
+    print_table(results)
+    if args.importtime:
+        import_profile(15)
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare and not compare_baseline(args.compare, results, args.threshold, args.metric):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+In-process load generator for the FastAPI detection routes.
+
+Drives main.app through httpx's ASGI transport (no server, no sockets) with a
+fixed number of concurrent clients and reports latency percentiles, throughput,
+status codes and peak RSS per route (latency and throughput count successful
+responses only). YOLO uses the stub model from common.py, so only the service
+overhead around inference is measured.
+
+    python benchmarks/load_test.py --concurrency 16 --requests 400
+    python benchmarks/load_test.py --compare benchmarks/load_baseline.json
+
+Exits with status 1 when --compare finds a regression above the threshold.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+from collections import Counter
+
+# every request sends the same frame, so a result cache would only measure cache hits
+os.environ.setdefault("RESULT_CACHE_MAX_MB", "0")
+
+import httpx
+
+from common import (PeakRSS, compare_baseline, encode_jpeg, install_stub_model,  # noqa: E402
+                    print_table, save_baseline, summarize, synthetic_field, use_offline_services)
+
+use_offline_services()
+
+from main import app  # noqa: E402
+
+
+def build_scenarios(jpeg: bytes) -> dict:
+    """:return: route name -> httpx request arguments."""
+    b64img = base64.b64encode(jpeg).decode()
+    return {
+        "POST /find-flower-yolo?format=png": dict(method="POST", url="/find-flower-yolo", json={"image": b64img}),
+        "POST /find-flower-yolo?format=coords": dict(method="POST", url="/find-flower-yolo?format=coords",
+                                                     json={"image": b64img}),
+        "POST /find-flower-yolo/upload?format=coords": dict(method="POST", url="/find-flower-yolo/upload?format=coords",
+                                                            content=jpeg,
+                                                            headers={"Content-Type": "application/octet-stream"}),
+        "POST /find-flower-cv": dict(method="POST", url="/find-flower-cv", json={"image": b64img}),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, request: dict, total: int, concurrency: int) -> dict:
+    latencies = []
+    statuses = Counter()
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.request(**request)
+            statuses[response.status_code] += 1
+            # rejected requests (e.g. 503 from a full detection pool) return early, keep them out of the latencies
+            if response.status_code < 400:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return summarize(latencies, elapsed, rss.peak_mb, concurrency=concurrency, errors=total - len(latencies),
+                     status_codes={str(code): count for code, count in sorted(statuses.items())})
+
+
+async def run_load(args) -> dict:
+    install_stub_model(detections=args.density)
+    image, _ = synthetic_field(args.width, args.height, args.density)
+    scenarios = build_scenarios(encode_jpeg(image))
+
+    # ASGITransport doesn't send lifespan events, so run the app's startup/shutdown hooks here
+    await app.router.startup()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for name, request in scenarios.items():
+                if args.only and args.only not in name:
+                    continue
+                await run_scenario(client, request, args.concurrency, args.concurrency)  # warm-up
+                results[name] = await run_scenario(client, request, args.requests, args.concurrency)
+                print(f"{name:<48} {results[name]['status_codes']}", file=sys.stderr)
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--density", type=int, default=10, help="Flowers per frame")
+    parser.add_argument("--only", help="Only run routes whose name contains this text")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown, 0.15 = 15%%")
+    parser.add_argument("--metric", default="p95_ms", help="Metric compared with the baseline")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_load(args))
+    print_table(results)
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare and not compare_baseline(args.compare, results, args.threshold, args.metric):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import numpy
+
+import config  # noqa: F401  (loads .env)
+from inference_scheduler import inference_scheduler
+from metrics import cascade_frames
+from openCV_method import detect_flowers_cv
+from postprocess import box_iou
+from yolo_method import raw_detections
+
+# how a cascade frame was handled
+CASCADE_PATHS = ("skipped", "regions", "full")
+
+
+def merge_windows(windows: List[List[int]]) -> List[List[int]]:
+    """Unions overlapping x_min, y_min, x_max, y_max windows until none overlap."""
+    merged: List[List[int]] = []
+    for window in windows:
+        window = list(window)
+        i = 0
+        while i < len(merged):
+            other = merged[i]
+            if window[0] < other[2] and other[0] < window[2] and window[1] < other[3] and other[1] < window[3]:
+                window = [min(window[0], other[0]), min(window[1], other[1]),
+                          max(window[2], other[2]), max(window[3], other[3])]
+                merged.pop(i)
+                i = 0
+            else:
+                i += 1
+        merged.append(window)
+    return merged
+
+
+def candidate_windows(boxes: numpy.ndarray, width: int, height: int, region_size: int) -> List[List[int]]:
+    """
+    A window of at least region_size x region_size (so the model sees some context)
+    around every candidate blob, shifted inside the frame, overlapping windows merged.
+    """
+    windows = []
+    for x0, y0, x1, y1 in boxes.tolist():
+        size_x = min(width, max(region_size, int(x1 - x0) + 1))
+        size_y = min(height, max(region_size, int(y1 - y0) + 1))
+        left = int(min(max((x0 + x1) / 2 - size_x / 2, 0), width - size_x))
+        top = int(min(max((y0 + y1) / 2 - size_y / 2, 0), height - size_y))
+        windows.append([left, top, left + size_x, top + size_y])
+    return merge_windows(windows)
+
+
+def count_matches(reference: numpy.ndarray, found: numpy.ndarray, iou_threshold: float = 0.5) -> int:
+    """Reference boxes that have an unmatched found box with IoU >= iou_threshold (greedy)."""
+    if not len(reference) or not len(found):
+        return 0
+    overlap = box_iou(reference, found)
+    matched = 0
+    for row in overlap:
+        j = int(row.argmax())
+        if row[j] >= iou_threshold:
+            matched += 1
+            overlap[:, j] = 0
+    return matched
+
+
+class CascadeDetector:
+    """
+    Runs the cheap HSV pass before YOLO. Frames without enough flower colored
+    pixels skip the model entirely; otherwise only windows around the candidate
+    blobs are sent to the model, unless they cover so much of the frame that a
+    single full-frame pass is cheaper.
+
+    A shadow_rate fraction of frames is also run through full-frame YOLO on a
+    background thread, which estimates the recall lost and the latency saved
+    against always running YOLO.
+    """
+
+    def __init__(self, min_candidates: int = 1, min_area_ratio: float = 0.0, min_blob_area: int = 4,
+                 region_size: int = 320, max_regions: int = 4, max_region_ratio: float = 0.5,
+                 shadow_rate: float = 0.0, match_iou: float = 0.5):
+        self.min_candidates = max(1, min_candidates)
+        self.min_area_ratio = min_area_ratio
+        self.min_blob_area = min_blob_area
+        self.region_size = region_size
+        self.max_regions = max_regions
+        self.max_region_ratio = max_region_ratio
+        self.shadow_rate = shadow_rate
+        self.match_iou = match_iou
+
+        self._lock = threading.Lock()
+        self._frames = {path: 0 for path in CASCADE_PATHS}
+        self._ms_total = {path: 0.0 for path in CASCADE_PATHS}
+        self._shadow = {"frames": 0, "reference_boxes": 0, "matched": 0, "missed_on_skipped": 0,
+                        "dropped": 0, "cascade_ms_total": 0.0, "full_ms_total": 0.0}
+        # one background worker; shadow frames arriving while it is busy are dropped, not queued
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cascade-shadow")
+        self._shadow_busy = threading.Semaphore(1)
+
+    @classmethod
+    def from_env(cls) -> "CascadeDetector":
+        return cls(
+            min_candidates=int(os.getenv("CASCADE_MIN_CANDIDATES", "1")),
+            min_area_ratio=float(os.getenv("CASCADE_MIN_AREA_RATIO", "0")),
+            min_blob_area=int(os.getenv("CASCADE_MIN_BLOB_AREA", "4")),
+            region_size=int(os.getenv("CASCADE_REGION_SIZE", "320")),
+            max_regions=int(os.getenv("CASCADE_MAX_REGIONS", "4")),
+            max_region_ratio=float(os.getenv("CASCADE_MAX_REGION_RATIO", "0.5")),
+            shadow_rate=float(os.getenv("CASCADE_SHADOW_RATE", "0")),
+        )
+
+    def plan(self, image) -> Tuple[str, List[List[int]], int]:
+        """
+        Runs the HSV pass on one frame.
+        :return: (path, windows, candidates): "skipped" (no model call), "regions"
+                 (run the model on the windows) or "full" (run it on the whole frame).
+        """
+        height, width = image.shape[:2]
+        boxes, _, _, areas = detect_flowers_cv(image, min_area=self.min_blob_area, return_areas=True)
+        # masked pixels, not bounding boxes: a thin diagonal streak has a large box but little flower color
+        area_ratio = float(areas.sum()) / (width * height)
+        if len(boxes) < self.min_candidates or area_ratio < self.min_area_ratio:
+            return "skipped", [], len(boxes)
+
+        windows = candidate_windows(boxes, width, height, self.region_size)
+        covered = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in windows) / (width * height)
+        if len(windows) > self.max_regions or covered >= self.max_region_ratio:
+            return "full", [[0, 0, width, height]], len(boxes)
+        return "regions", windows, len(boxes)
+
+    def detect(self, image, model_name: str = None, conf: float = 0.3):
+        """
+        :return: (boxes, confidences, classes, cascade_info) with boxes in full-frame pixels.
+        """
+        start = time.perf_counter()
+        path, windows, candidates = self.plan(image)
+
+        all_boxes, all_conf, all_cls = [numpy.empty((0, 4))], [numpy.empty(0)], [numpy.empty(0)]
+        if windows:
+            # crops are views into the frame; each goes through the scheduler so they batch together
+            futures = [inference_scheduler.submit(image[y0:y1, x0:x1], model_name, conf=conf)
+                       for x0, y0, x1, y1 in windows]
+            for (x0, y0, _, _), future in zip(windows, futures):
+                boxes, confidences, classes = raw_detections(future.result()[0])
+                all_boxes.append(boxes.astype(numpy.float64) + (x0, y0, x0, y0))
+                all_conf.append(confidences)
+                all_cls.append(classes if classes is not None else numpy.zeros(len(boxes)))
+
+        boxes, confidences, classes = numpy.concatenate(all_boxes), numpy.concatenate(all_conf), numpy.concatenate(all_cls)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        cascade_frames.inc(path=path)
+        with self._lock:
+            self._frames[path] += 1
+            self._ms_total[path] += elapsed_ms
+
+        if self.shadow_rate > 0 and random.random() < self.shadow_rate:
+            self._submit_shadow(image, model_name, conf, path, boxes, elapsed_ms)
+
+        info = {"path": path, "candidates": candidates, "regions": [
+            {"x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0} for x0, y0, x1, y1 in windows
+        ], "ms": round(elapsed_ms, 2)}
+        return boxes, confidences, classes, info
+
+    def _submit_shadow(self, image, model_name, conf, path, boxes, cascade_ms):
+        if not self._shadow_busy.acquire(blocking=False):
+            with self._lock:
+                self._shadow["dropped"] += 1
+            return
+        # the response is drawn onto the frame in place, so the shadow pass gets its own copy
+        frame = image.copy()
+
+        def run():
+            try:
+                start = time.perf_counter()
+                reference = raw_detections(inference_scheduler.predict(frame, model_name, conf=conf)[0])[0]
+                full_ms = (time.perf_counter() - start) * 1000
+                matched = count_matches(reference, boxes, self.match_iou)
+                with self._lock:
+                    self._shadow["frames"] += 1
+                    self._shadow["reference_boxes"] += len(reference)
+                    self._shadow["matched"] += matched
+                    if path == "skipped":
+                        self._shadow["missed_on_skipped"] += len(reference)
+                    self._shadow["cascade_ms_total"] += cascade_ms
+                    self._shadow["full_ms_total"] += full_ms
+            except Exception as e:
+                logging.warning(f"Cascade shadow pass failed: {e}")
+            finally:
+                self._shadow_busy.release()
+
+        self._shadow_pool.submit(run)
+
+    def stop(self):
+        self._shadow_pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            frames = sum(self._frames.values())
+            shadow = dict(self._shadow)
+            mean_ms = {path: round(self._ms_total[path] / count, 2) if count else 0
+                       for path, count in self._frames.items()}
+            counts = dict(self._frames)
+
+        shadow_frames = shadow.pop("frames")
+        cascade_ms, full_ms = shadow.pop("cascade_ms_total"), shadow.pop("full_ms_total")
+        return {
+            "min_candidates": self.min_candidates,
+            "min_area_ratio": self.min_area_ratio,
+            "region_size": self.region_size,
+            "max_regions": self.max_regions,
+            "max_region_ratio": self.max_region_ratio,
+            "shadow_rate": self.shadow_rate,
+            "frames": frames,
+            **counts,
+            "short_circuit_rate": round(counts["skipped"] / frames, 4) if frames else 0,
+            "mean_ms": mean_ms,
+            # cascade vs always-YOLO on the sampled frames
+            "shadow": {
+                "frames": shadow_frames,
+                **shadow,
+                "recall": round(shadow["matched"] / shadow["reference_boxes"], 4) if shadow["reference_boxes"] else None,
+                "mean_cascade_ms": round(cascade_ms / shadow_frames, 2) if shadow_frames else 0,
+                "mean_full_yolo_ms": round(full_ms / shadow_frames, 2) if shadow_frames else 0,
+                "speedup": round(full_ms / cascade_ms, 2) if cascade_ms else None,
+            },
+        }
+
+
+cascade_detector = CascadeDetector.from_env()
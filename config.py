@@ -0,0 +1,17 @@
+"""
+Loads .env once per process, before any module reads its settings with os.getenv.
+Every module that reads the environment at import time imports this first.
+"""
+import os
+
+from dotenv import load_dotenv
+
+# Load .env file (variables already set in the environment take precedence)
+load_dotenv()
+
+# "eager": load and warm up the models before serving (the default),
+# "background": serve immediately and warm up in the background (/ready answers 503 until done),
+# "lazy": load each model on its first request
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "eager")
+if STARTUP_WARMUP not in ("eager", "background", "lazy"):
+    raise ValueError(f"Unknown STARTUP_WARMUP '{STARTUP_WARMUP}', use 'eager', 'background' or 'lazy'")
@@ -1,6 +1,19 @@
+import asyncio
 import logging
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager, suppress
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional, Dict
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from typing import Optional, Dict, List
+
+from metrics import db_call_errors, db_call_seconds
+
+DUPLICATE_KEY_ERROR = 11000
 
 # MongoDB connection manager
 class MongoDBManager:
@@ -29,14 +42,222 @@ class MongoDBManager:
             logging.info("Closed MongoDB connection")
 
 
+# Per-statement timing shared by every pooled PostgreSQL connection
+class StatementStats:
+    def __init__(self, slow_ms: float = 500.0):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = {}
+
+    @staticmethod
+    def _normalize(query) -> str:
+        if isinstance(query, bytes):
+            query = query.decode(errors="replace")
+        return re.sub(r"\s+", " ", str(query)).strip()[:120]
+
+    def record(self, query, elapsed_ms: float):
+        statement = self._normalize(query)
+        db_call_seconds.observe(elapsed_ms / 1000, database="postgres", operation=statement.split(" ", 1)[0].upper())
+        with self._lock:
+            stats = self._stats.setdefault(statement, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if elapsed_ms >= self.slow_ms:
+            logging.warning(f"Slow PostgreSQL statement ({elapsed_ms:.0f} ms): {statement}")
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                statement: {
+                    "count": stats["count"],
+                    "mean_ms": round(stats["total_ms"] / stats["count"], 2),
+                    "max_ms": round(stats["max_ms"], 2),
+                }
+                for statement, stats in self._stats.items()
+            }
+
+
+statement_stats = StatementStats()
+
+
+class TimedCursor(extensions.cursor):
+    """psycopg2 cursor that records the latency of every statement."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            statement_stats.record(query, (time.perf_counter() - start) * 1000)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            statement_stats.record(query, (time.perf_counter() - start) * 1000)
+
+
+# PostgreSQL connection pool manager
+class PostgresManager:
+    def __init__(self):
+        self.pool: Optional[ThreadedConnectionPool] = None
+        self.dsn: Optional[str] = None
+        self.pool_size = 5
+        self.max_overflow = 10
+        self.timeout = 30.0
+        self._slots: Optional[threading.BoundedSemaphore] = None
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._idle = 0
+
+    def connect(self, dsn: str, pool_size: int = 5, max_overflow: int = 10, timeout: float = 30.0):
+        """
+        Configures the pool and opens pool_size connections.
+
+        Up to max_overflow extra connections are opened under load and closed again
+        when returned. If PostgreSQL is unreachable the error is logged and the pool
+        is created on first use instead, so the app can still start.
+        """
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(pool_size + max_overflow)
+        try:
+            self._ensure_pool()
+            logging.info(f"Connected to PostgreSQL (pool size {pool_size}, overflow {max_overflow})")
+        except Exception as e:
+            logging.error(f"Failed to connect to PostgreSQL, will retry on first use: {e}")
+
+    def _ensure_pool(self) -> ThreadedConnectionPool:
+        if self.pool is None:
+            with self._lock:
+                if self.pool is None:
+                    if self.dsn is None:
+                        raise RuntimeError("PostgreSQL pool is not configured")
+                    self.pool = ThreadedConnectionPool(
+                        self.pool_size, self.pool_size + self.max_overflow,
+                        self.dsn, cursor_factory=TimedCursor,
+                    )
+                    self._idle = self.pool_size
+        return self.pool
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a pooled connection, waiting up to `timeout` seconds for a free one.
+        The transaction is rolled back if the block raises; commit explicitly otherwise.
+        """
+        if self._slots is None:
+            raise RuntimeError("PostgreSQL pool is not configured")
+        wait_start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            db_call_errors.inc(database="postgres", operation="acquire")
+            raise RuntimeError(f"Timed out after {self.timeout}s waiting for a PostgreSQL connection")
+
+        connection = None
+        try:
+            pool = self._ensure_pool()
+            connection = pool.getconn()
+            db_call_seconds.observe(time.perf_counter() - wait_start, database="postgres", operation="acquire")
+            with self._lock:
+                self._in_use += 1
+                self._idle = max(0, self._idle - 1)
+            # an open transaction (e.g. the block raised) is rolled back by _release
+            yield connection
+        finally:
+            # the permit is released however returning the connection goes
+            try:
+                if connection is not None:
+                    self._release(connection)
+            finally:
+                self._slots.release()
+
+    def _release(self, connection):
+        with self._lock:
+            self._in_use -= 1
+        broken = bool(connection.closed)
+        # never hand an open transaction to the next borrower
+        if not broken and connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except Exception as e:
+                # e.g. a dead socket psycopg2 hasn't noticed yet (closed is still 0)
+                logging.warning(f"Discarding PostgreSQL connection that failed to roll back: {e}")
+                broken = True
+        with self._lock:
+            # same rule as putconn: kept while fewer than pool_size are idle, overflow and broken ones closed
+            if not broken and self._idle < self.pool_size:
+                self._idle += 1
+        self.pool.putconn(connection, close=broken)
+
+    @asynccontextmanager
+    async def async_connection(self):
+        """
+        connection() for coroutines. Waiting for a free slot, opening the pool and the
+        rollback/return on exit can all block, so they run in a worker thread instead of
+        on the event loop. Calls on the connection itself still need asyncio.to_thread.
+        """
+        manager = self.connection()
+        enter = asyncio.ensure_future(asyncio.to_thread(manager.__enter__))
+        try:
+            connection = await asyncio.shield(enter)
+        except asyncio.CancelledError:
+            # the worker thread may still get a connection, hand it back once it has
+            with suppress(Exception):
+                await enter
+                await asyncio.to_thread(manager.__exit__, None, None, None)
+            raise
+
+        try:
+            yield connection
+        except BaseException as e:
+            if not await asyncio.to_thread(manager.__exit__, type(e), e, e.__traceback__):
+                raise
+        else:
+            await asyncio.to_thread(manager.__exit__, None, None, None)
+
+    def check_health(self) -> str:
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+                cursor.fetchone()
+            connection.rollback()
+        return "healthy"
+
+    def stats(self) -> Dict:
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "in_use": self._in_use,
+            "idle": self._idle if self.pool is not None else 0,
+            "statements": statement_stats.snapshot(),
+        }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
+            self.pool = None
+            self._idle = 0
+            logging.info("Closed PostgreSQL connection pool")
+
+
 # Database connection manager
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, mongo_timeseries: bool = False, timeseries_granularity: str = "minutes"):
         self.mongo_manager = MongoDBManager()
+        self.postgres = PostgresManager()
+        self.indexes_ready = False
+        # store operations as a MongoDB time-series collection (only applies when it doesn't exist yet)
+        self.mongo_timeseries = mongo_timeseries
+        self.timeseries_granularity = timeseries_granularity
 
-    async def connect_all(self, mongo_uri: str, mongo_db_name: str):
+    async def connect_all(self, mongo_uri: str, mongo_db_name: str, postgres_dsn: Optional[str] = None,
+                          pool_size: int = 5, max_overflow: int = 10, pool_timeout: float = 30.0):
         """
-        Connects to all necessary databases (currently only MongoDB).
+        Connects to all necessary databases (MongoDB and the PostgreSQL pool).
         """
         try:
             await self.mongo_manager.connect(mongo_uri, mongo_db_name)
@@ -44,11 +265,16 @@ class DatabaseManager:
             logging.error(f"Failed to connect to MongoDB: {e}")
             raise
 
+        if postgres_dsn:
+            # opening the initial connections is blocking, keep it off the event loop
+            await asyncio.to_thread(self.postgres.connect, postgres_dsn, pool_size, max_overflow, pool_timeout)
+
     async def close_all(self):
         """
         Closes all database connections.
         """
         await self.mongo_manager.close()
+        await asyncio.to_thread(self.postgres.close)
 
     async def add_to_mongo(self, data: Dict, collection_name: str = "operations"):
         """
@@ -60,13 +286,81 @@ class DatabaseManager:
         """
         try:
             collection = self.mongo_manager.db[collection_name]  # Access the MongoDB collection
-            result = await collection.insert_one(data)  # Insert the document
+            with db_call_seconds.time(database="mongo", operation="insert_one"):
+                result = await collection.insert_one(data)  # Insert the document
             logging.info(f"Document added to MongoDB with ID: {result.inserted_id}")
             return result.inserted_id
         except Exception as e:
+            db_call_errors.inc(database="mongo", operation="insert_one")
             logging.error(f"Failed to add data to MongoDB: {e}")
             raise
 
+    async def ensure_indexes(self, collection_name: str = "operations"):
+        """
+        Creates the MongoDB collection layout and indexes the service relies on (no-op when they exist).
+
+        - (rover_id, created_at, _id) serves the per-rover telemetry reads: time-range filter,
+          time ordering and the _id tie-break of the pagination cursor, without a sort stage.
+        - A unique index on the PostgreSQL row id makes replayed migrations idempotent.
+          Time-series collections don't support unique indexes, so there replays rely on
+          the chunk being deleted only after a successful write.
+        """
+        if self.indexes_ready:
+            return
+        db = self.mongo_manager.db
+        try:
+            if self.mongo_timeseries and collection_name not in await db.list_collection_names():
+                await db.create_collection(collection_name, timeseries={
+                    "timeField": "created_at", "metaField": "rover_id", "granularity": self.timeseries_granularity,
+                })
+                logging.info(f"Created time-series collection {collection_name}")
+
+            collection = db[collection_name]
+            with db_call_seconds.time(database="mongo", operation="create_index"):
+                await collection.create_index(
+                    [("rover_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], name="rover_created_at"
+                )
+        except Exception as e:
+            db_call_errors.inc(database="mongo", operation="create_index")
+            logging.warning(f"Could not create the telemetry index on {collection_name}: {e}")
+            return
+
+        options = (await collection.options()) if self.mongo_timeseries else {}
+        if "timeseries" not in options:
+            try:
+                await collection.create_index("id", unique=True, name="operation_id_unique")
+            except Exception as e:
+                # existing duplicates block the unique index; migrations still work, just not idempotently
+                logging.warning(f"Could not create unique index on {collection_name}.id: {e}")
+                return
+        self.indexes_ready = True
+
+    async def add_many_to_mongo(self, documents: List[Dict], collection_name: str = "operations") -> int:
+        """
+        Inserts documents in one unordered bulk write.
+
+        Duplicate-key errors are ignored so replaying a batch after a crash is safe when
+        the collection has a unique index; any other write error is raised.
+
+        Returns:
+            int: The number of newly inserted documents.
+        """
+        if not documents:
+            return 0
+        collection = self.mongo_manager.db[collection_name]
+        try:
+            with db_call_seconds.time(database="mongo", operation="insert_many"):
+                result = await collection.insert_many(documents, ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                db_call_errors.inc(database="mongo", operation="insert_many")
+                logging.error(f"Failed to add documents to MongoDB: {e}")
+                raise
+            logging.info(f"Skipped {len(errors)} documents already in MongoDB")
+            return e.details.get("nInserted", 0)
+
     async def check_health(self):
         """
         Checks the health of all database connections.
@@ -74,7 +368,7 @@ class DatabaseManager:
         Returns:
             dict: A dictionary containing the health status of each database.
         """
-        health_status = {"mongo": "unknown"}
+        health_status = {"mongo": "unknown", "postgres": "unknown"}
 
         # Check MongoDB health
         try:
@@ -87,6 +381,13 @@ class DatabaseManager:
             logging.error(f"MongoDB health check failed: {e}")
             health_status["mongo"] = f"unhealthy: {str(e)}"
 
+        # Check PostgreSQL health
+        try:
+            health_status["postgres"] = await asyncio.to_thread(self.postgres.check_health)
+        except Exception as e:
+            logging.error(f"PostgreSQL health check failed: {e}")
+            health_status["postgres"] = f"unhealthy: {str(e)}"
+
         return health_status
 
 
@@ -1,10 +1,6 @@
-import psycopg2
-from psycopg2.extensions import connection as _connection
-from dotenv import load_dotenv
 import os
 
-# Load .env file
-load_dotenv()
+import config  # noqa: F401  (loads .env)
 
 # Get the connection string components
 db_host = os.getenv("DB_HOST")
@@ -18,12 +14,3 @@ db_connection_string = os.getenv(
     "DB_CONNECTION", 
     f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 )
-
-def get_db_connection() -> _connection:
-    """Establish and return a database connection."""
-    try:
-        connection = psycopg2.connect(db_connection_string)
-        return connection
-    except Exception as e:
-        raise RuntimeError(f"Error connecting to the database: {e}")
-
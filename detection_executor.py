@@ -0,0 +1,125 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import config  # noqa: F401  (loads .env)
+
+
+class ExecutorBusy(Exception):
+    """Raised when the detection queue is full; routes answer 503 with Retry-After."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Detection queue is full, retry later")
+        self.retry_after = retry_after
+
+
+def _init_process_worker():
+    # preload and warm up the models once per worker process
+    from model_registry import model_registry
+    model_registry.load_all()
+
+
+class DetectionExecutor:
+    """
+    Runs CPU-bound detection off the event loop.
+
+    backend="thread" shares one model per process between worker threads (and lets the
+    inference scheduler batch their frames); backend="process" preloads the model in
+    every worker process and sidesteps the GIL for decode/draw/encode work. At most
+    workers + queue_size calls are admitted; anything beyond that raises ExecutorBusy.
+    """
+
+    def __init__(self, backend: str = "thread", workers: Optional[int] = None,
+                 queue_size: Optional[int] = None, retry_after: int = 1):
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown detection backend '{backend}', use 'thread' or 'process'")
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = self.workers * 4 if queue_size is None else queue_size
+        self.retry_after = retry_after
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        # every process worker has started and loaded its models (see warm_up)
+        self.warmed_up = False
+
+    @classmethod
+    def from_env(cls) -> "DetectionExecutor":
+        workers = os.getenv("DETECTION_WORKERS")
+        queue_size = os.getenv("DETECTION_QUEUE_SIZE")
+        return cls(
+            backend=os.getenv("DETECTION_BACKEND", "thread"),
+            workers=int(workers) if workers else None,
+            queue_size=int(queue_size) if queue_size else None,
+            retry_after=int(os.getenv("DETECTION_RETRY_AFTER", "1")),
+        )
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    def start(self):
+        if self._pool is not None:
+            return
+        if self.backend == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="detection")
+        logging.info(f"Started {self.backend} detection pool with {self.workers} workers")
+
+    async def warm_up(self):
+        """
+        Starts every process worker before traffic arrives; each loads and warms the models
+        in its initializer. Workers are spawned on demand, so one call per worker is
+        submitted at once. A no-op for the thread backend, which shares the process's models.
+        """
+        self.start()
+        if self.backend == "process":
+            loop = asyncio.get_running_loop()
+            pids = await asyncio.gather(*(loop.run_in_executor(self._pool, os.getpid) for _ in range(self.workers)))
+            logging.info(f"Warmed up {len(set(pids))} detection worker processes")
+        self.warmed_up = True
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self.warmed_up = False
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Runs fn(*args, **kwargs) in the pool, or raises ExecutorBusy when it is full."""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                raise ExecutorBusy(self.retry_after)
+            self._in_flight += 1
+
+        try:
+            self.start()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self._in_flight,
+            "rejected": self._rejected,
+        }
+
+
+detection_executor = DetectionExecutor.from_env()
@@ -0,0 +1,72 @@
+import struct
+from typing import Optional, Tuple
+
+import cv2
+import numpy
+
+
+def decode_image_bytes(data: bytes):
+    """
+    Decodes encoded image bytes (PNG, JPEG, ...) straight from the buffer.
+    :return: BGR image, or None when the bytes are not a readable image.
+    """
+    # frombuffer wraps the request bytes without copying them
+    return cv2.imdecode(numpy.frombuffer(data, numpy.uint8), cv2.IMREAD_COLOR)
+
+
+# JPEG start-of-frame markers (SOF0-SOF15 without DHT, JPG and DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_format(data: bytes) -> Optional[str]:
+    """:return: "png", "jpeg" or "webp" from the magic bytes, None for anything else."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def image_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Reads (width, height) from the PNG / JPEG / WebP header without decoding any pixels.
+    :return: None when the format is unknown or the header is truncated.
+    """
+    kind = image_format(data)
+    try:
+        if kind == "png":
+            width, height = struct.unpack(">II", data[16:24])
+            return width, height
+
+        if kind == "jpeg":
+            offset = 2
+            while offset + 9 < len(data):
+                if data[offset] != 0xFF:
+                    return None
+                marker = data[offset + 1]
+                if marker == 0xFF:
+                    # fill byte
+                    offset += 1
+                    continue
+                if marker in _JPEG_SOF:
+                    height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+                    return width, height
+                segment_length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+                offset += 2 + segment_length
+            return None
+
+        if kind == "webp":
+            chunk = data[12:16]
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L":
+                bits = int.from_bytes(data[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    except struct.error:
+        return None
+    return None
@@ -0,0 +1,226 @@
+import glob
+import logging
+import os
+import threading
+import time
+from typing import List, Tuple
+
+import cv2
+import numpy
+
+from postprocess import nms
+from preprocess import letterbox_blob
+
+# backends accepted by YOLO_BACKEND ("auto" picks one from the weights file extension)
+BACKENDS = ("auto", "ultralytics", "onnxruntime", "openvino")
+
+# class offset used to run class-aware NMS as a single pass (same trick as ultralytics)
+_CLASS_OFFSET = 7680
+
+
+class _Array:
+    """Stands in for a torch tensor: `.cpu().numpy()` returns the wrapped array."""
+
+    def __init__(self, array: numpy.ndarray):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self) -> numpy.ndarray:
+        return self.array
+
+
+class Boxes:
+    def __init__(self, xyxy: numpy.ndarray, conf: numpy.ndarray, cls: numpy.ndarray):
+        self.xyxy = _Array(xyxy)
+        self.conf = _Array(conf)
+        self.cls = _Array(cls)
+
+
+class Results:
+    """The part of the ultralytics Results interface the detection code uses."""
+
+    def __init__(self, boxes: Boxes, orig_shape: Tuple[int, int], speed: dict):
+        self.boxes = boxes
+        self.orig_shape = orig_shape
+        self.speed = speed
+
+
+def letterbox(image: numpy.ndarray, size: int, color: int = 114):
+    """
+    Resizes keeping the aspect ratio and pads to a size x size square, like the
+    ultralytics LetterBox used at export time.
+    :return: (padded image, scale factor, (pad_left, pad_top)).
+    """
+    height, width = image.shape[:2]
+    gain = min(size / height, size / width)
+    new_width, new_height = int(round(width * gain)), int(round(height * gain))
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(color, color, color))
+    return padded, gain, (left, top)
+
+
+def to_blob(frames: List[numpy.ndarray]) -> numpy.ndarray:
+    """Stacks letterboxed BGR frames into a normalized float32 NCHW RGB batch."""
+    batch = numpy.stack(frames)[..., ::-1].transpose(0, 3, 1, 2)
+    return numpy.ascontiguousarray(batch, dtype=numpy.float32) / 255.0
+
+
+def decode_predictions(prediction: numpy.ndarray, conf: float, iou: float, gain: float,
+                       pad: Tuple[int, int], shape: Tuple[int, int], max_det: int = 300):
+    """
+    Turns one raw YOLOv8 output of shape (4 + classes, anchors) into boxes in
+    original-frame pixels.
+    :return: (xyxy boxes, confidences, class ids) float32 arrays.
+    """
+    scores_per_class = prediction[4:]
+    classes = scores_per_class.argmax(axis=0)
+    scores = scores_per_class[classes, numpy.arange(scores_per_class.shape[1])]
+    keep = scores > conf
+    if not keep.any():
+        empty = numpy.empty((0,), dtype=numpy.float32)
+        return numpy.empty((0, 4), dtype=numpy.float32), empty, empty
+
+    cx, cy, w, h = prediction[:4, keep]
+    boxes = numpy.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    scores, classes = scores[keep], classes[keep]
+
+    kept = nms(boxes + (classes * _CLASS_OFFSET)[:, None], scores, iou)[:max_det]
+    boxes, scores, classes = boxes[kept], scores[kept], classes[kept]
+
+    # undo the letterbox
+    boxes -= (pad[0], pad[1], pad[0], pad[1])
+    boxes /= gain
+    height, width = shape
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return boxes.astype(numpy.float32), scores.astype(numpy.float32), classes.astype(numpy.float32)
+
+
+class NumpyYOLO:
+    """
+    YOLOv8 detection model run by an exported-graph runtime, with NumPy/OpenCV
+    pre- and post-processing instead of torch. Called like an ultralytics model
+    (`model(frames, conf=0.3, verbose=False)`) and returns compatible results.
+    """
+
+    # the runtimes below are safe to call from several threads at once
+    thread_safe = True
+
+    def __init__(self, path: str, imgsz: int, dynamic_batch: bool):
+        self.path = path
+        self.imgsz = imgsz
+        self.dynamic_batch = dynamic_batch
+
+    def _infer(self, blob: numpy.ndarray) -> numpy.ndarray:
+        raise NotImplementedError
+
+    def __call__(self, source, conf: float = 0.25, iou: float = 0.7, max_det: int = 300, **_) -> List[Results]:
+        frames = source if isinstance(source, list) else [source]
+
+        start = time.perf_counter()
+        # written into this thread's reused buffers; the runtimes copy the input before returning
+        blob, transforms = letterbox_blob(frames, self.imgsz)
+
+        inferred = time.perf_counter()
+        if self.dynamic_batch or len(frames) == 1:
+            predictions = self._infer(blob)
+        else:
+            # a graph exported with a fixed batch of 1 runs the frames one by one
+            predictions = numpy.concatenate([self._infer(blob[i:i + 1]) for i in range(len(frames))])
+
+        decoded = time.perf_counter()
+        results = []
+        for frame, (gain, pad), prediction in zip(frames, transforms, predictions):
+            boxes = decode_predictions(prediction, conf, iou, gain, pad, frame.shape[:2], max_det)
+            results.append(Results(Boxes(*boxes), frame.shape[:2], {}))
+        done = time.perf_counter()
+
+        speed = {
+            "preprocess": (inferred - start) * 1000 / len(frames),
+            "inference": (decoded - inferred) * 1000 / len(frames),
+            "postprocess": (done - decoded) * 1000 / len(frames),
+        }
+        for result in results:
+            result.speed = speed
+        return results
+
+
+class OnnxRuntimeYOLO(NumpyYOLO):
+    """ONNX Runtime on CPU. ONNX_THREADS sets the intra-op thread count (0 = runtime default)."""
+
+    def __init__(self, path: str, threads: int = 0):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        shape = self.session.get_inputs()[0].shape
+        imgsz = shape[2] if isinstance(shape[2], int) else 640
+        super().__init__(path, imgsz, dynamic_batch=not isinstance(shape[0], int))
+
+    def _infer(self, blob: numpy.ndarray) -> numpy.ndarray:
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVINOYOLO(NumpyYOLO):
+    """OpenVINO on CPU, from an .xml IR (or its export folder) or directly from an .onnx file."""
+
+    def __init__(self, path: str, device: str = "CPU"):
+        import openvino
+
+        if os.path.isdir(path):
+            # ultralytics exports the IR as a "<name>_openvino_model/" folder
+            path = glob.glob(os.path.join(path, "*.xml"))[0]
+        core = openvino.Core()
+        model = core.read_model(path)
+        shape = model.input(0).get_partial_shape()
+        imgsz = shape[2].get_length() if shape[2].is_static else 640
+        self.compiled = core.compile_model(model, device, {"PERFORMANCE_HINT": "LATENCY"})
+        # an infer request holds per-call state, so every thread gets its own
+        self._local = threading.local()
+        super().__init__(path, imgsz, dynamic_batch=shape[0].is_dynamic)
+
+    def _infer(self, blob: numpy.ndarray) -> numpy.ndarray:
+        request = getattr(self._local, "request", None)
+        if request is None:
+            request = self._local.request = self.compiled.create_infer_request()
+        request.infer({0: blob})
+        return request.get_output_tensor(0).data.copy()
+
+
+def resolve_backend(path: str, backend: str = "auto") -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown YOLO backend '{backend}', use one of: {', '.join(BACKENDS)}")
+    if backend != "auto":
+        return backend
+    if os.path.isdir(path):
+        return "openvino"
+    extension = os.path.splitext(path)[1].lower()
+    return {".onnx": "onnxruntime", ".xml": "openvino"}.get(extension, "ultralytics")
+
+
+def load_model(path: str, backend: str = "auto"):
+    """
+    Loads weights with the requested backend. Only the ultralytics backend imports
+    torch, so an ONNX / OpenVINO deployment starts without it.
+    """
+    backend = resolve_backend(path, backend)
+    logging.info(f"Loading {path} with the {backend} backend")
+    if backend == "onnxruntime":
+        return OnnxRuntimeYOLO(path, threads=int(os.getenv("ONNX_THREADS", "0")))
+    if backend == "openvino":
+        return OpenVINOYOLO(path, device=os.getenv("OPENVINO_DEVICE", "CPU"))
+
+    from ultralytics import YOLO
+    return YOLO(path)
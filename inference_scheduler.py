@@ -0,0 +1,159 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import List, Optional
+
+import config  # noqa: F401  (loads .env)
+from model_registry import ModelRegistry, model_registry
+
+
+class _Request:
+    __slots__ = ("image", "model_name", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, image, model_name: Optional[str], kwargs: dict):
+        self.image = image
+        self.model_name = model_name
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+    @property
+    def key(self):
+        # only requests for the same model and inference arguments can share a forward pass
+        return self.model_name, tuple(sorted(self.kwargs.items()))
+
+
+class InferenceScheduler:
+    """
+    Collects concurrent inference requests into micro-batches.
+
+    A dispatcher thread waits for the first queued frame. A lone frame is dispatched
+    at once; only when a second one is already queued does it keep collecting, until
+    either max_batch_size frames are queued or max_wait_ms has passed since that
+    second frame. Frames arriving during a forward pass queue up for the next batch.
+    It runs one batched forward pass per model and hands each caller its own result.
+    """
+
+    def __init__(self, registry: ModelRegistry, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.registry = registry
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._requests = 0
+        self._wait_ms_total = 0.0
+
+    @classmethod
+    def from_env(cls, registry: ModelRegistry) -> "InferenceScheduler":
+        return cls(
+            registry,
+            max_batch_size=int(os.getenv("YOLO_MAX_BATCH_SIZE", "8")),
+            max_wait_ms=float(os.getenv("YOLO_MAX_WAIT_MS", "10")),
+        )
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+                self._thread.start()
+
+    def submit(self, image, model_name: Optional[str] = None, **kwargs) -> Future:
+        """Queues one frame; the future resolves to a single-element results list."""
+        self._ensure_started()
+        request = _Request(image, model_name, kwargs)
+        self._queue.put(request)
+        return request.future
+
+    def predict(self, image, model_name: Optional[str] = None, **kwargs) -> list:
+        """Blocking helper, drop-in for calling the model on one frame."""
+        return self.submit(image, model_name, **kwargs).result()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        # nothing else waiting: don't hold a lone request for max_wait
+        try:
+            request = self._queue.get_nowait()
+        except queue.Empty:
+            return batch
+        if request is None:
+            self._queue.put(None)
+            return batch
+        batch.append(request)
+
+        # concurrent load: the deadline starts with the second request
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            groups = {}
+            for request in self._collect(first):
+                groups.setdefault(request.key, []).append(request)
+
+            for requests in groups.values():
+                self._run_batch(requests)
+
+    def _run_batch(self, requests: List[_Request]):
+        started = time.perf_counter()
+        with self._stats_lock:
+            self._batch_sizes[len(requests)] += 1
+            self._requests += len(requests)
+            self._wait_ms_total += sum((started - r.enqueued_at) * 1000 for r in requests)
+
+        try:
+            model = self.registry.get(requests[0].model_name)
+            results = model.predict([r.image for r in requests], **requests[0].kwargs)
+        except Exception as e:
+            logging.error(f"Batched inference failed for {len(requests)} frame(s): {e}")
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        for request, result in zip(requests, results):
+            request.future.set_result([result])
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": batches,
+                "mean_batch_size": round(self._requests / batches, 2) if batches else 0,
+                "mean_queue_wait_ms": round(self._wait_ms_total / self._requests, 2) if self._requests else 0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            }
+
+
+inference_scheduler = InferenceScheduler.from_env(model_registry)
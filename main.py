@@ -1,26 +1,64 @@
-from datetime import datetime
+import asyncio
+import base64
+import csv
+import io
+import json
 import os
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+import time
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import HTMLResponse
-from dotenv import load_dotenv
+import psutil
 
+from cascade import cascade_detector
+from config import STARTUP_WARMUP
 from database import DatabaseManager
-from db_con import get_db_connection
+from db_con import db_connection_string
 
 from demo_page import demo_page
-from openCV_method import find_flower_cv
-from upload_image import upload_base64_image
-from yolo_method import find_flower_yolo
-
-load_dotenv()
+from migration import MigrationScheduler
+from detection_executor import ExecutorBusy, detection_executor
+from inference_scheduler import inference_scheduler
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, registry as metrics_registry, stage_timer
+from model_registry import model_registry
+from result_cache import result_cache
+from rovers import insert_rovers
+from stream_detection import active_streams, run_detection_stream
+from telemetry import NUMERIC_FIELDS, TELEMETRY_FIELDS, downsample_telemetry, parse_fields, query_telemetry
+from openCV_method import (CV_CLOSE_KERNEL, CV_HSV_LOWER, CV_HSV_UPPER, CV_MAX_SIDE, CV_MIN_AREA, CV_OPEN_KERNEL,
+                           find_flower_cv_bytes, parse_hsv)
+from upload_image import blob_service
+from yolo_method import find_flower_yolo_batch, find_flower_yolo_bytes
 
 app = FastAPI()
 
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+# store operations in a MongoDB time-series collection (only when the collection is created)
+MONGO_TIMESERIES = os.getenv("MONGO_TIMESERIES", "false").lower() == "true"
+MONGO_TIMESERIES_GRANULARITY = os.getenv("MONGO_TIMESERIES_GRANULARITY", "minutes")
+
+PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "5"))
+PG_MAX_OVERFLOW = int(os.getenv("PG_MAX_OVERFLOW", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))
+
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "32"))
+# largest X-Image-Result header of format=binary responses; proxies commonly reject headers over 8 KB
+IMAGE_RESULT_HEADER_MAX_BYTES = int(os.getenv("IMAGE_RESULT_HEADER_MAX_BYTES", "6144"))
+# default of the ?cascade= query parameter of the YOLO routes
+CASCADE_DEFAULT = os.getenv("CASCADE_DEFAULT", "false").lower() == "true"
+# "false" keeps this instance from running the background migration at all (benchmarks, read-only replicas)
+MIGRATION_SCHEDULER = os.getenv("MIGRATION_SCHEDULER", "true").lower() == "true"
+# longest POST /rover/trigger/?wait=true blocks before answering 202 with the still running job
+MIGRATION_WAIT_TIMEOUT = float(os.getenv("MIGRATION_WAIT_TIMEOUT", "300"))
+# most rovers one /rovers/bulk request may register
+ROVERS_BULK_MAX = int(os.getenv("ROVERS_BULK_MAX", "10000"))
+
 
 # disable CORS for localhost and direct file
 app.add_middleware(
@@ -31,28 +69,176 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# request latency / status / in-flight metrics, exported on /metrics
+app.add_middleware(MetricsMiddleware)
+
 # http request format
 class ImageRequest(BaseModel):
     image: str
 
 # DB connection
-db_manager = DatabaseManager()
+db_manager = DatabaseManager(mongo_timeseries=MONGO_TIMESERIES, timeseries_granularity=MONGO_TIMESERIES_GRANULARITY)
+# keeps a reference to the startup index task
+index_task: Optional[asyncio.Future] = None
+# drains operations into MongoDB in the background, see /rover/trigger/
+migration_scheduler = MigrationScheduler.from_env(db_manager)
 
 @app.on_event("startup")
 async def startup_db():
-    await db_manager.connect_all(MONGO_URI, MONGO_DB_NAME)
+    global index_task
+    await db_manager.connect_all(
+        MONGO_URI, MONGO_DB_NAME, db_connection_string,
+        pool_size=PG_POOL_SIZE, max_overflow=PG_MAX_OVERFLOW, pool_timeout=PG_POOL_TIMEOUT,
+    )
+    # create the telemetry indexes in the background, an unreachable MongoDB must not block startup
+    index_task = asyncio.ensure_future(db_manager.ensure_indexes())
+    if MIGRATION_SCHEDULER:
+        migration_scheduler.start()
+
+# startup / warm-up durations reported by /ready
+startup_timings = {}
+# keeps a reference to the STARTUP_WARMUP=background task
+warmup_task: Optional[asyncio.Future] = None
+
+def mark_ready():
+    startup_timings["ready_after_ms"] = round((time.time() - psutil.Process().create_time()) * 1000, 1)
+
+def warm_up_models():
+    # load and warm up every configured model once
+    start = time.perf_counter()
+    model_registry.load_all()
+    startup_timings["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    mark_ready()
+
+async def warm_up():
+    if detection_executor.backend == "thread":
+        await run_in_threadpool(warm_up_models)
+        return
+    # with the process backend every worker loads its own models, so start them all
+    start = time.perf_counter()
+    await detection_executor.warm_up()
+    startup_timings["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    mark_ready()
+
+def models_ready() -> bool:
+    if STARTUP_WARMUP == "lazy":
+        return True
+    if detection_executor.backend == "process":
+        return detection_executor.warmed_up
+    return model_registry.is_loaded()
+
+@app.on_event("startup")
+async def startup_models():
+    global warmup_task
+    start = time.perf_counter()
+    detection_executor.start()
+    if STARTUP_WARMUP == "eager":
+        await warm_up()
+    elif STARTUP_WARMUP == "background":
+        # start serving now, /ready answers 503 until the models are warm
+        warmup_task = asyncio.ensure_future(warm_up())
+    if detection_executor.backend == "thread":
+        model_registry.start_watcher()
+    startup_timings["startup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    if STARTUP_WARMUP == "lazy":
+        mark_ready()
 
 @app.on_event("shutdown")
 async def shutdown_db():
+    await migration_scheduler.stop()
     await db_manager.close_all()
+    await blob_service.close()
+
+@app.on_event("shutdown")
+async def shutdown_models():
+    model_registry.stop_watcher()
+    cascade_detector.stop()
+    inference_scheduler.stop()
+    detection_executor.shutdown()
 
 # routes
 @app.get("/", response_class=HTMLResponse)
 async def root():
     return demo_page()
 
+def b64decode_image(b64img: str, pipeline: str) -> bytes:
+    with stage_timer(pipeline, "b64decode"):
+        return base64.b64decode(b64img)
+
+async def run_cached(namespace: str, params: dict, fn, data: bytes, *args, **kwargs):
+    """Runs fn(data, ...) in the detection pool unless the same image and parameters are cached."""
+    if not result_cache.enabled:
+        return await detection_executor.run(fn, data, *args, **kwargs)
+
+    key = await run_in_threadpool(result_cache.make_key, data, namespace, params)
+    cached = await run_in_threadpool(result_cache.get, key)
+    if cached is not None:
+        return cached
+
+    result = await detection_executor.run(fn, data, *args, **kwargs)
+    await run_in_threadpool(result_cache.put, key, result)
+    return result
+
+def cached_batch(namespace: str, params: dict, images: List[Optional[bytes]]):
+    """
+    Looks up every frame of a batch in the result cache, under the same keys as the single-image routes.
+    :return: (keys, responses): cache key and cached response per frame, None where unreadable or not cached.
+    """
+    if not result_cache.enabled:
+        return [None] * len(images), [None] * len(images)
+    keys = [result_cache.make_key(data, namespace, params) if data is not None else None for data in images]
+    return keys, [result_cache.get(key) if key is not None else None for key in keys]
+
+def cache_batch_results(keys: List[Optional[str]], responses: List[dict]):
+    # only successful frames, like run_cached (which never caches a raised error)
+    for key, response in zip(keys, responses):
+        if key is not None and response.get("status") == 200:
+            result_cache.put(key, response)
+
+# response formats of the YOLO routes, see yolo_method.render_detections
+OutputFormat = Literal["png", "jpeg", "coords", "binary"]
+CvOutputFormat = Literal["png", "jpeg", "coords"]
+SortKey = Literal["x", "y", "confidence"]
+
+class CvParams:
+    """Query parameters of the OpenCV routes (defaults come from the CV_* settings)."""
+
+    def __init__(
+        self,
+        response_format: CvOutputFormat = Query("png", alias="format"),
+        quality: int = Query(90, ge=1, le=100),
+        sort: SortKey = "y",
+        min_conf: float = Query(0.0, ge=0, le=1, description="Minimum blob roundness (the CV confidence, not a probability)"),
+        top_k: Optional[int] = Query(None, ge=1),
+        hsv_lower: Optional[str] = Query(None, description="h,s,v lower bound of the flower color, e.g. 0,0,200"),
+        hsv_upper: Optional[str] = Query(None, description="h,s,v upper bound of the flower color, e.g. 180,30,255"),
+        open_kernel: int = Query(CV_OPEN_KERNEL, ge=0, le=31),
+        close_kernel: int = Query(CV_CLOSE_KERNEL, ge=0, le=31),
+        min_area: int = Query(CV_MIN_AREA, ge=0),
+        max_side: int = Query(CV_MAX_SIDE, ge=0, le=8192, description="0 keeps the full resolution"),
+    ):
+        try:
+            lower = parse_hsv(hsv_lower) if hsv_lower else CV_HSV_LOWER
+            upper = parse_hsv(hsv_upper) if hsv_upper else CV_HSV_UPPER
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        self.options = {
+            "output": response_format,
+            "quality": quality,
+            "sort_key": sort,
+            "min_conf": min_conf,
+            "top_k": top_k,
+            "hsv_lower": lower,
+            "hsv_upper": upper,
+            "open_kernel": open_kernel,
+            "close_kernel": close_kernel,
+            "min_area": min_area,
+            "max_side": max_side,
+        }
+
 @app.post("/find-flower-cv")
-async def find_flower_with_cv(request: ImageRequest):
+async def find_flower_with_cv(request: ImageRequest, params: CvParams = Depends()):
     try:
         # extract the Base64 part of the input string
         if "," in request.image:
@@ -60,17 +246,93 @@ async def find_flower_with_cv(request: ImageRequest):
         else:
             b64img = request.image
 
-        # call OpenCV method
-        result_base64 = find_flower_cv(b64img)
+        # decode once so the cache can key on the image bytes
+        data = await run_in_threadpool(b64decode_image, b64img, "cv")
 
-        # return as JSON
-        return {"image": f"data:image/png;base64,{result_base64}"}
+        # call OpenCV method in the detection pool (or serve a cached result)
+        response = await run_cached("cv", params.options, find_flower_cv_bytes, data, **params.options)
 
+        # return as JSON, same coordinate schema as the YOLO routes
+        return response
+
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing image with cv: {str(e)}")
 
+class YoloParams:
+    """Query parameters shared by the YOLO routes."""
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        response_format: OutputFormat = Query("png", alias="format"),
+        quality: int = Query(90, ge=1, le=100),
+        sort: SortKey = "y",
+        min_conf: float = Query(0.0, ge=0, le=1),
+        top_k: Optional[int] = Query(None, ge=1),
+        classes: Optional[str] = Query(None, description="Comma separated class ids, e.g. 0,2"),
+        iou: Optional[float] = Query(None, gt=0, le=1),
+        tiled: bool = False,
+        tile_size: int = Query(640, ge=64, le=4096),
+        tile_overlap: float = Query(0.2, ge=0, lt=1),
+        tile_workers: int = Query(1, ge=1, le=16),
+        cascade: bool = Query(CASCADE_DEFAULT, description="HSV pre-pass, YOLO only on frames/regions with flower colors"),
+    ):
+        try:
+            class_ids = [int(c) for c in classes.split(",") if c.strip()] if classes else None
+        except ValueError:
+            raise HTTPException(status_code=422, detail="classes must be a comma separated list of integers")
+
+        self.model = model
+        self.options = {
+            "output": response_format,
+            "quality": quality,
+            "sort_key": sort,
+            "min_conf": min_conf,
+            "top_k": top_k,
+            "classes": class_ids,
+            "iou": iou,
+            "tiled": tiled,
+            "tile_size": tile_size,
+            "tile_overlap": tile_overlap,
+            "tile_workers": tile_workers,
+            "cascade": cascade,
+        }
+
+def image_result_header(coords: list, max_bytes: int = IMAGE_RESULT_HEADER_MAX_BYTES):
+    """
+    Compact JSON of as many coordinates as fit in max_bytes, in their sorted order.
+    :return: (header value, number of coordinates kept).
+    """
+    items = [json.dumps(coord, separators=(",", ":")) for coord in coords]
+    size = 2
+    kept = 0
+    for item in items:
+        size += len(item) + (1 if kept else 0)
+        if size > max_bytes:
+            break
+        kept += 1
+    return "[" + ",".join(items[:kept]) + "]", kept
+
+def detection_response(result: dict):
+    """
+    Sends "binary" results as the raw image body with the coordinates in a header.
+    A header too large for proxies is cut to the first coordinates and marked with
+    X-Image-Result-Truncated; X-Image-Result-Count always has the full count
+    (use format=coords for every coordinate).
+    """
+    if "image_bytes" not in result:
+        return result
+    coords = result["imageResult"]
+    header, kept = image_result_header(coords)
+    headers = {"X-Image-Result": header, "X-Image-Result-Count": str(len(coords))}
+    if kept < len(coords):
+        headers["X-Image-Result-Truncated"] = "true"
+    return Response(content=result["image_bytes"], media_type=result["media_type"], headers=headers)
+
 @app.post("/find-flower-yolo")
-async def find_flower_with_yolo(request: ImageRequest):
+async def find_flower_with_yolo(request: ImageRequest, params: YoloParams = Depends()):
     try:
         # extract the Base64 part of the input string
         if "," in request.image:
@@ -78,20 +340,231 @@ async def find_flower_with_yolo(request: ImageRequest):
         else:
             b64img = request.image
 
-        # call YOLO inference function
-        response = find_flower_yolo(b64img)
+        # decode once so the cache can key on the image bytes
+        data = await run_in_threadpool(b64decode_image, b64img, "yolo")
 
-        # return as JSON
-        return response
+        # call YOLO inference function in the detection pool (or serve a cached result)
+        response = await run_cached(
+            f"yolo:{model_registry.version(params.model)}", params.options,
+            find_flower_yolo_bytes, data, params.model, **params.options
+        )
+
+        # return as JSON (or raw bytes for format=binary)
+        return detection_response(response)
 
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing image with YOLO: {str(e)}")
 
+async def read_image_body(request: Request) -> bytes:
+    """Returns the raw image bytes of a multipart/form-data ("image" field) or octet-stream body."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing 'image' file field in multipart body")
+        return await upload.read()
+    return await request.body()
+
+@app.post("/find-flower-cv/upload")
+async def find_flower_with_cv_upload(request: Request, params: CvParams = Depends()):
+    # same as /find-flower-cv, but the image is sent as binary instead of base64 JSON
+    data = await read_image_body(request)
+    try:
+        return await run_cached("cv", params.options, find_flower_cv_bytes, data, **params.options)
+
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing image with cv: {str(e)}")
+
+@app.post("/find-flower-yolo/upload")
+async def find_flower_with_yolo_upload(request: Request, params: YoloParams = Depends()):
+    # same as /find-flower-yolo, but the image is sent as binary instead of base64 JSON
+    data = await read_image_body(request)
+    try:
+        response = await run_cached(
+            f"yolo:{model_registry.version(params.model)}", params.options,
+            find_flower_yolo_bytes, data, params.model, **params.options
+        )
+        return detection_response(response)
+
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing image with YOLO: {str(e)}")
+
+class BatchImageRequest(BaseModel):
+    images: List[str]
+
+def decode_base64_item(image: str) -> Optional[bytes]:
+    """Decodes one base64 (or data URL) image of a batch, None if it isn't valid base64."""
+    b64img = image.split(",")[1] if "," in image else image
+    try:
+        return base64.b64decode(b64img, validate=True)
+    except Exception:
+        return None
+
+async def read_batch_body(request: Request) -> List[Optional[bytes]]:
+    """Returns the images of a JSON {"images": [...]} or multipart ("images" file fields) batch body."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        uploads = [upload for upload in form.getlist("images") if not isinstance(upload, str)]
+        images = [await upload.read() for upload in uploads]
+    else:
+        try:
+            batch = BatchImageRequest.model_validate_json(await request.body())
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Invalid batch body: {str(e)}")
+        images = await run_in_threadpool(lambda: [decode_base64_item(image) for image in batch.images])
+
+    if not images:
+        raise HTTPException(status_code=400, detail="No images in batch")
+    if len(images) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_IMAGES} images per batch")
+    return images
+
+@app.post("/find-flower-cv/batch")
+async def find_flower_with_cv_batch(request: Request, params: CvParams = Depends()):
+    # every frame runs in parallel in the detection pool; failures only affect their own entry
+    images = await read_batch_body(request)
+
+    async def detect(data: Optional[bytes]) -> dict:
+        try:
+            if data is None:
+                raise ValueError("Failed to decode image from Base64 input.")
+            return await run_cached("cv", params.options, find_flower_cv_bytes, data, **params.options)
+        except ExecutorBusy as e:
+            return {"status": 503, "error": str(e)}
+        except Exception as e:
+            return {"status": 400, "error": f"Error processing image with cv: {str(e)}"}
+
+    return {"status": 200, "results": await asyncio.gather(*(detect(data) for data in images))}
+
+@app.post("/find-flower-yolo/batch")
+async def find_flower_with_yolo_batch(request: Request, params: YoloParams = Depends()):
+    # all frames go through one batched model call; failures only affect their own entry
+    images = await read_batch_body(request)
+    try:
+        # frames seen before (here or on the single-image routes) come from the result cache
+        namespace = f"yolo:{model_registry.version(params.model)}"
+        # format=binary can't be batched (find_flower_yolo_batch rejects it), so never answer it from the cache
+        if params.options["output"] == "binary":
+            keys, results = [None] * len(images), [None] * len(images)
+        else:
+            keys, results = await run_in_threadpool(cached_batch, namespace, params.options, images)
+        misses = [index for index, result in enumerate(results) if result is None]
+        if misses:
+            detected = await detection_executor.run(find_flower_yolo_batch, [images[index] for index in misses],
+                                                    params.model, **params.options)
+            for index, result in zip(misses, detected):
+                results[index] = result
+            await run_in_threadpool(cache_batch_results, [keys[index] for index in misses], detected)
+        return {"status": 200, "results": results}
+
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing images with YOLO: {str(e)}")
+
+@app.websocket("/ws/detect")
+async def detect_stream(websocket: WebSocket, params: YoloParams = Depends()):
+    # live rover feed: frames in, coordinates out (always format=coords)
+    options = {**params.options, "output": "coords"}
+
+    async def detect(data: bytes) -> dict:
+        return await detection_executor.run(find_flower_yolo_bytes, data, params.model, **options)
+
+    await run_detection_stream(websocket, detect)
+
+@app.get("/ws/stats")
+async def stream_stats():
+    # per-stream FPS, dropped frames and end-to-end latency of connected feeds
+    return {"streams": [session.stats() for session in active_streams.values()]}
+
+@app.get("/live")
+async def liveness():
+    # the process is up and serving requests (models may still be loading)
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def readiness():
+    # ready once the default model is warm (with the process backend: once every worker has
+    # loaded its copy); with STARTUP_WARMUP=lazy models load on first use, so a started process is ready
+    ready = models_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "warming_up",
+            "warmup": STARTUP_WARMUP,
+            "models": {name: model_registry.is_loaded(name) for name in model_registry.paths},
+            "startup": startup_timings,
+        },
+    )
+
+@app.get("/models")
+async def list_models():
+    # load time, warm-up latency and memory footprint of each model version
+    return model_registry.stats()
+
+@app.get("/inference/stats")
+async def inference_stats():
+    # detection pool load plus queue depth and batch-size histogram of the YOLO scheduler
+    return {"executor": detection_executor.stats(), "scheduler": inference_scheduler.stats()}
+
+@app.get("/cascade/stats")
+async def cascade_stats():
+    # short-circuited frames per path and the shadow-sampled recall / latency against always-YOLO
+    return cascade_detector.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    # hit, miss and eviction counters of the detection result cache
+    return result_cache.stats()
+
+@app.get("/blob/stats")
+async def blob_stats():
+    # uploads and deduplicated (skipped) uploads of the blob upload service
+    return blob_service.stats()
+
+# existing component stats exported as gauges, read only when /metrics is scraped
+metrics_registry.gauge(
+    "detection_executor_in_flight", "Detection jobs running or queued in the executor.",
+    callback=lambda: {(): detection_executor.stats()["in_flight"]})
+metrics_registry.gauge(
+    "inference_scheduler_queue_depth", "Frames waiting for a batched forward pass.",
+    callback=lambda: {(): inference_scheduler.stats()["queue_depth"]})
+metrics_registry.gauge(
+    "result_cache", "Detection result cache counters.", ("field",),
+    callback=lambda: {(field,): value for field, value in result_cache.stats().items()
+                      if field in ("entries", "bytes", "hits", "disk_hits", "misses", "evictions")})
+metrics_registry.gauge(
+    "postgres_pool_connections", "PostgreSQL pool connections by state.", ("state",),
+    callback=lambda: {(state,): db_manager.postgres.stats()[state] for state in ("in_use", "idle")})
+metrics_registry.gauge(
+    "blob_uploads", "Blob uploads done and skipped as duplicates.", ("field",),
+    callback=lambda: {(field,): blob_service.stats()[field] for field in ("uploads", "deduplicated")})
+metrics_registry.gauge(
+    "detection_streams_active", "Connected /ws/detect streams.",
+    callback=lambda: {(): len(active_streams)})
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Prometheus text format: per-route and per-stage latency histograms, counters and gauges
+    return PlainTextResponse(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/db-health")
 async def health_check():
     health_status = await db_manager.check_health()
     overall_status = "healthy" if all(status == "healthy" for status in health_status.values()) else "unhealthy"
-    return JSONResponse(content={"status": overall_status, "details": health_status})
+    return JSONResponse(content={
+        "status": overall_status,
+        "details": health_status,
+        "postgres_pool": db_manager.postgres.stats(),
+    })
 
 class RoverData(BaseModel):
     initial_id: int
@@ -102,31 +575,121 @@ class RoverData(BaseModel):
 def add_rover(data: RoverData):
     """Route to add a new rover to the database."""
     try:
-        # Get database connection
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        # SQL query to insert data into the rovers table
-        insert_query = """
-        INSERT INTO rovers (initial_id, rover_status, user_id)
-        VALUES (%s, %s, %s)
-        RETURNING rover_id, created_at;
-        """
-        
-        # Execute the query with provided data
-        cursor.execute(insert_query, (data.initial_id, data.rover_status, data.user_id))
-        result = cursor.fetchone()
-        
-        # Commit the transaction and close the connection
-        connection.commit()
-        cursor.close()
-        connection.close()
+        # Borrow a pooled database connection
+        with db_manager.postgres.connection() as connection:
+            cursor = connection.cursor()
+
+            # SQL query to insert data into the rovers table
+            insert_query = """
+            INSERT INTO rovers (initial_id, rover_status, user_id)
+            VALUES (%s, %s, %s)
+            RETURNING rover_id, created_at;
+            """
+
+            # Execute the query with provided data
+            cursor.execute(insert_query, (data.initial_id, data.rover_status, data.user_id))
+            result = cursor.fetchone()
+
+            # Commit the transaction and close the cursor (the connection goes back to the pool)
+            connection.commit()
+            cursor.close()
         
         # Return the inserted rover ID and timestamp
         return {"rover_id": result[0], "created_at": result[1]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to add rover: {str(e)}")
 
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+rover_list = TypeAdapter(List[RoverData])
+
+def parse_rovers_body(body: bytes, content_type: str) -> List[RoverData]:
+    """Parses a JSON array, NDJSON (one rover per line) or CSV (with a header row) of RoverData."""
+    if content_type.startswith(NDJSON_CONTENT_TYPES):
+        rovers = []
+        for number, line in enumerate(body.splitlines(), start=1):
+            if line.strip():
+                try:
+                    rovers.append(RoverData.model_validate_json(line))
+                except ValidationError as e:
+                    raise ValueError(f"line {number}: {e}")
+        return rovers
+    if content_type.startswith("text/csv"):
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        rovers = []
+        for number, row in enumerate(reader, start=2):
+            try:
+                rovers.append(RoverData.model_validate(row))
+            except ValidationError as e:
+                raise ValueError(f"line {number}: {e}")
+        return rovers
+    return rover_list.validate_json(body)
+
+@app.post("/rovers/bulk")
+async def add_rovers_bulk(request: Request, upsert: bool = False):
+    """
+    Registers many rovers in one transaction. The body is a JSON array, NDJSON
+    (application/x-ndjson) or CSV (text/csv) of RoverData; upsert=true updates rovers
+    whose initial_id already exists (needs a unique index on rovers.initial_id).
+    Returns the rover_id / created_at of every rover in input order.
+    """
+    body = await request.body()
+    try:
+        rovers = await run_in_threadpool(parse_rovers_body, body, request.headers.get("content-type", ""))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid rovers body: {str(e)}")
+    if not rovers:
+        raise HTTPException(status_code=400, detail="No rovers in body")
+    if len(rovers) > ROVERS_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {ROVERS_BULK_MAX} rovers per request")
+
+    try:
+        results = await run_in_threadpool(
+            insert_rovers, db_manager.postgres,
+            [(rover.initial_id, rover.rover_status, rover.user_id) for rover in rovers], upsert,
+        )
+        return {"count": len(results), "rovers": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to add rovers: {str(e)}")
+
+@app.get("/rovers/{rover_id}/telemetry")
+async def rover_telemetry(
+    rover_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description=f"Comma separated, any of: {', '.join(TELEMETRY_FIELDS)}"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    order: Literal["asc", "desc"] = "asc",
+):
+    """Time-ordered battery / temperature / humidity readings of one rover, without the images."""
+    try:
+        return await query_telemetry(db_manager, rover_id, start, end, parse_fields(fields, TELEMETRY_FIELDS),
+                                     limit, cursor, order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read telemetry: {str(e)}")
+
+@app.get("/rovers/{rover_id}/telemetry/downsample")
+async def rover_telemetry_downsample(
+    rover_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description=f"Comma separated, any of: {', '.join(NUMERIC_FIELDS)}"),
+    unit: Literal["minute", "hour", "day", "week", "month"] = "hour",
+    bin_size: int = Query(1, ge=1, le=1000),
+    max_buckets: int = Query(1000, ge=1, le=10000),
+):
+    """Per-bucket avg / min / max of the numeric telemetry, aggregated by MongoDB for charts."""
+    try:
+        buckets = await downsample_telemetry(db_manager, rover_id, start, end, parse_fields(fields, NUMERIC_FIELDS),
+                                             unit, bin_size, max_buckets)
+        return {"rover_id": rover_id, "unit": unit, "bin_size": bin_size, "buckets": buckets}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to aggregate telemetry: {str(e)}")
+
 # Input model
 class Base64ImageInput(BaseModel):
     base64_string: str
@@ -135,96 +698,76 @@ class Base64ImageInput(BaseModel):
 @app.post("/upload-image/")
 async def upload_image(data: Base64ImageInput):
     try:
-        # Call the utility function to upload the base64 image
-        blob_url = upload_base64_image(data.base64_string, data.file_extension)
+        # Upload through the shared async blob service (doesn't block the event loop)
+        blob_url = await blob_service.upload_base64(data.base64_string, data.file_extension)
         return {"message": "Image uploaded successfully", "blob_url": blob_url}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-class ImageData(BaseModel):
-    id: int
-    rover_id: int
-    random_id: int
-    battery_status: float
-    temp: float
-    humidity: float
-    result_image: str
-    image_data: str
-    created_at: datetime 
-
-@app.post("/rover/trigger/")
-async def run_trigger():
+@app.post("/upload-image/stream")
+async def upload_image_stream(
+    request: Request,
+    file_extension: str = "png",
+    encoding: Optional[Literal["binary", "base64"]] = None,
+):
+    """
+    Streams the request body to blob storage chunk by chunk.
+    The body is raw image bytes, or base64 text (optionally with a data URL prefix) when
+    encoding=base64 or the Content-Type is text/*.
+    """
+    if encoding is None:
+        encoding = "base64" if request.headers.get("content-type", "").startswith("text/") else "binary"
     try:
-        # Get database connection
-        connection = get_db_connection()  # Ensure this supports async if necessary
-        cursor = connection.cursor()
-
-        # SQL query to get the count of operations
-        get_count_query = "SELECT COUNT(*) FROM operations;"
-        cursor.execute(get_count_query)
-        result1 = cursor.fetchone()
-
-        if result1 is None or result1[0] <= 0:
-            return {"message": "No operations found."}
-
-        count = result1[0]
-        for _ in range(count):
-            # SQL query to fetch the oldest operation
-            get_data_query = """
-            SELECT id, rover_id, random_id, battery_status, temp, humidity, 
-                   result_image, image_data, created_at
-            FROM operations
-            ORDER BY created_at ASC
-            LIMIT 1;
-            """
-            cursor.execute(get_data_query)
-            result2 = cursor.fetchone()
-
-            if result2 is None:
-                break
-
-            # Map query result to ImageData model
-            data = ImageData(
-                id=result2[0],
-                rover_id=result2[1],
-                random_id=result2[2],
-                battery_status=result2[3],
-                temp=result2[4],
-                humidity=result2[5],
-                result_image=result2[6],
-                image_data=result2[7],
-                created_at=result2[8],
-            )
-
-            # Remove "data:image/png;base64," from result_image string
-            updated_result_image = data.result_image.replace("data:image/png;base64,", "")
-            blob_url = upload_base64_image(updated_result_image, "jpeg")
-
-            # Add data to MongoDB using db_manager
-            mongo_data = {
-                "id": data.id,
-                "rover_id": data.rover_id,
-                "random_id": data.random_id,
-                "battery_status": data.battery_status,
-                "temp": data.temp,
-                "humidity": data.humidity,
-                "blob_url": blob_url,
-                "image_data": data.image_data,
-                "created_at": data.created_at,
-            }
-
-            await db_manager.add_to_mongo(mongo_data)
-
-            # Delete the record from PostgreSQL
-            delete_data_query = "DELETE FROM operations WHERE id = %s;"
-            cursor.execute(delete_data_query, (data.id,))
-
-        # Commit the transaction and close the SQL connection
-        connection.commit()
-        cursor.close()
-        connection.close()
-
-        return {"message": "Trigger executed and data added to MongoDB successfully."}
-
+        blob_url, size = await blob_service.upload_stream(
+            request.stream(), file_extension, base64_encoded=encoding == "base64"
+        )
+        return {"message": "Image uploaded successfully", "blob_url": blob_url, "bytes": size}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to run trigger: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/rover/trigger/", status_code=202)
+async def run_trigger(response: Response, wait: bool = False):
+    # queue a run of the background migration and answer right away with its job id;
+    # wait=true blocks until the job is done (the old synchronous behaviour), at most MIGRATION_WAIT_TIMEOUT seconds
+    if not migration_scheduler.running:
+        raise HTTPException(status_code=503, detail="The migration scheduler is not running on this instance")
+    job = migration_scheduler.trigger()
+    queued = {"message": "Migration queued.", "status_url": f"/rover/trigger/{job.id}"}
+    if not wait:
+        return {**queued, **job.to_dict()}
+
+    try:
+        await asyncio.wait_for(job.done.wait(), timeout=MIGRATION_WAIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        # still running, poll status_url
+        return {**queued, "message": "Migration still running.", **job.to_dict()}
+
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Failed to run trigger: {job.error}")
+    if job.status == "cancelled":
+        raise HTTPException(status_code=503, detail="Migration cancelled, the scheduler was stopped")
+    if job.status == "skipped":
+        # another instance is the leader; nothing was migrated here
+        response.status_code = 409
+        return {"message": f"Migration skipped: {job.error}.", **job.to_dict()}
+    response.status_code = 200
+    if job.rows == 0:
+        return {"message": "No operations found.", **job.to_dict()}
+    return {"message": "Trigger executed and data added to MongoDB successfully.", **job.to_dict()}
+
+@app.get("/rover/trigger/{job_id}")
+async def trigger_status(job_id: str):
+    # progress of a queued, running or finished migration job
+    job = migration_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown migration job")
+    return job.to_dict()
+
+@app.get("/migration/stats")
+async def migration_stats():
+    # scheduler interval, leadership and the most recent jobs
+    return migration_scheduler.stats()
@@ -0,0 +1,401 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import config  # noqa: F401  (loads .env)
+
+from database import DatabaseManager
+from image_io import image_dimensions, image_format
+from upload_image import blob_service
+
+# columns copied from the PostgreSQL operations table into MongoDB
+OPERATION_COLUMNS = (
+    "id", "rover_id", "random_id", "battery_status", "temp", "humidity",
+    "result_image", "image_data", "created_at",
+)
+
+CLAIM_CHUNK_QUERY = f"""
+SELECT {", ".join(OPERATION_COLUMNS)}
+FROM operations
+ORDER BY created_at ASC
+LIMIT %s
+FOR UPDATE SKIP LOCKED;
+"""
+
+DELETE_CHUNK_QUERY = "DELETE FROM operations WHERE id = ANY(%s);"
+
+# where the raw frame (image_data) of a migrated row goes:
+# "inline" keeps the base64 string in the document, "blob" uploads it and keeps a reference
+IMAGE_STORAGE_MODES = ("inline", "blob")
+
+
+async def _upload_result_images(rows: List[Dict], concurrency: int) -> List[str]:
+    """Uploads the result image of every row, at most `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(row: Dict) -> str:
+        # Remove "data:image/png;base64," from result_image string
+        updated_result_image = row["result_image"].replace("data:image/png;base64,", "")
+        async with semaphore:
+            # the blob is named after the row id, so a replayed chunk overwrites instead of duplicating
+            return await blob_service.upload_base64(updated_result_image, "jpeg", f"operations/{row['id']}")
+
+    return await asyncio.gather(*(upload(row) for row in rows))
+
+
+def _image_reference(payload: Optional[str]) -> Optional[Dict]:
+    """
+    Decodes one base64 frame and reads what its reference keeps, without decoding pixels.
+    :return: {"data", "sha256", "size", "width", "height", "format"}, None when it isn't a readable image.
+    """
+    if not payload:
+        return None
+    if payload.startswith("data:"):
+        payload = payload.split(",", 1)[-1]
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    kind = image_format(data)
+    dimensions = image_dimensions(data)
+    if kind is None or dimensions is None:
+        return None
+    return {"data": data, "sha256": hashlib.sha256(data).hexdigest(), "size": len(data),
+            "width": dimensions[0], "height": dimensions[1], "format": kind}
+
+
+async def offload_image_payloads(payloads: List[Optional[str]], concurrency: int = 8) -> List[Optional[Dict]]:
+    """
+    Uploads base64 frames to blob storage, named after their SHA-256, so identical
+    frames (within the batch and across runs) are stored once.
+
+    :return: Per payload {"url", "sha256", "size", "width", "height", "content_type"},
+             or None for payloads that aren't a readable image (those stay inline).
+    """
+    decoded = await asyncio.to_thread(lambda: [_image_reference(payload) for payload in payloads])
+
+    unique = {image["sha256"]: image for image in decoded if image is not None}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(image: Dict) -> str:
+        async with semaphore:
+            return await blob_service.upload_bytes(image["data"], image["format"], deduplicate=True,
+                                                   sha256=image["sha256"])
+
+    urls = dict(zip(unique, await asyncio.gather(*(upload(image) for image in unique.values()))))
+    return [
+        {
+            "url": urls[image["sha256"]],
+            "sha256": image["sha256"],
+            "size": image["size"],
+            "width": image["width"],
+            "height": image["height"],
+            "content_type": f"image/{image['format']}",
+        } if image is not None else None
+        for image in decoded
+    ]
+
+
+def _to_mongo_document(row: Dict, blob_url: str, image: Optional[Dict] = None) -> Dict:
+    """:param image: Blob reference replacing the inline image_data (see offload_image_payloads)."""
+    document = {
+        "id": row["id"],
+        "rover_id": row["rover_id"],
+        "random_id": row["random_id"],
+        "battery_status": row["battery_status"],
+        "temp": row["temp"],
+        "humidity": row["humidity"],
+        "blob_url": blob_url,
+        "created_at": row["created_at"],
+    }
+    if image is not None:
+        document["image"] = image
+    else:
+        document["image_data"] = row["image_data"]
+    return document
+
+
+async def migrate_chunk(db_manager: DatabaseManager, chunk_size: int, upload_concurrency: int,
+                        image_storage: str = "inline") -> int:
+    """
+    Moves one chunk of the oldest operations rows to MongoDB.
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED, so concurrent runs (other workers or
+    instances) take disjoint chunks. The chunk is deleted and committed only after the
+    MongoDB write succeeds; if anything fails the rows are released and retried by the
+    next run, where the fixed blob names and the unique MongoDB id index make the
+    replay idempotent.
+
+    With image_storage="blob" the raw frames go to content-addressed blobs as well and
+    the documents keep only a reference (URL, hash, size and dimensions).
+
+    :return: Number of rows migrated (0 when the table is drained).
+    """
+    async with db_manager.postgres.async_connection() as connection:
+        cursor = connection.cursor()
+        await asyncio.to_thread(cursor.execute, CLAIM_CHUNK_QUERY, (chunk_size,))
+        rows = [dict(zip(OPERATION_COLUMNS, values)) for values in await asyncio.to_thread(cursor.fetchall)]
+
+        if not rows:
+            await asyncio.to_thread(connection.rollback)
+            cursor.close()
+            return 0
+
+        blob_urls = await _upload_result_images(rows, upload_concurrency)
+        if image_storage == "blob":
+            images = await offload_image_payloads([row["image_data"] for row in rows], upload_concurrency)
+        else:
+            images = [None] * len(rows)
+        documents = [_to_mongo_document(row, blob_url, image) for row, blob_url, image in zip(rows, blob_urls, images)]
+        await db_manager.add_many_to_mongo(documents)
+
+        # Delete the whole chunk from PostgreSQL in one statement
+        await asyncio.to_thread(cursor.execute, DELETE_CHUNK_QUERY, ([row["id"] for row in rows],))
+        await asyncio.to_thread(connection.commit)
+        cursor.close()
+        return len(rows)
+
+
+async def migrate_operations(db_manager: DatabaseManager, chunk_size: int = 100,
+                             upload_concurrency: int = 8, max_rows: Optional[int] = None,
+                             progress: Optional[Callable[[int, int], None]] = None,
+                             image_storage: str = "inline") -> Dict:
+    """
+    Drains the PostgreSQL operations table into MongoDB chunk by chunk.
+
+    Each chunk is its own transaction, so a crash loses at most the chunk in flight
+    (which is then retried) and progress is never rolled back wholesale.
+
+    :param progress: Called with (rows migrated, chunks) after every chunk.
+    :param image_storage: "inline" or "blob", see IMAGE_STORAGE_MODES.
+    :return: Migration statistics including rows per second.
+    """
+    if image_storage not in IMAGE_STORAGE_MODES:
+        raise ValueError(f"Unknown image storage '{image_storage}', use one of: {', '.join(IMAGE_STORAGE_MODES)}")
+    await db_manager.ensure_indexes()
+
+    start = time.perf_counter()
+    migrated = 0
+    chunks = 0
+    while max_rows is None or migrated < max_rows:
+        size = chunk_size if max_rows is None else min(chunk_size, max_rows - migrated)
+        count = await migrate_chunk(db_manager, size, upload_concurrency, image_storage)
+        if count == 0:
+            break
+        migrated += count
+        chunks += 1
+        if progress is not None:
+            progress(migrated, chunks)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "rows": migrated,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(migrated / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    logging.info(f"Migrated operations to MongoDB: {stats}")
+    return stats
+
+
+# pg_try_advisory_lock key shared by every instance; whoever holds it runs the migration
+MIGRATION_LOCK_ID = 7_202_201
+
+LOCK_QUERY = "SELECT pg_try_advisory_lock(%s);"
+UNLOCK_QUERY = "SELECT pg_advisory_unlock(%s);"
+
+
+class MigrationJob:
+    """One run of the migration, as reported by GET /rover/trigger/{job_id}."""
+
+    def __init__(self, trigger: str):
+        self.id = uuid.uuid4().hex
+        self.trigger = trigger
+        self.status = "queued"
+        self.rows = 0
+        self.chunks = 0
+        self.stats: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.done = asyncio.Event()
+
+    def update(self, rows: int, chunks: int):
+        self.rows = rows
+        self.chunks = chunks
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.now(timezone.utc)
+        self.done.set()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "trigger": self.trigger,
+            "status": self.status,
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "stats": self.stats,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class MigrationScheduler:
+    """
+    Drains the operations table in the background of the app instead of inside a request.
+
+    Runs every `interval` seconds (0 = only when triggered) and whenever trigger() pokes it.
+    Before each run the instance tries to take a PostgreSQL advisory lock; only the
+    instance holding it migrates, the others mark the job "skipped". Triggers that
+    arrive while a job is still queued share that job.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, interval: float = 60.0, chunk_size: int = 100,
+                 upload_concurrency: int = 8, lock_id: int = MIGRATION_LOCK_ID, history: int = 100,
+                 image_storage: str = "inline"):
+        self.db_manager = db_manager
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.upload_concurrency = upload_concurrency
+        self.lock_id = lock_id
+        self.history = history
+        self.image_storage = image_storage
+        self.jobs: "OrderedDict[str, MigrationJob]" = OrderedDict()
+        self.leader = False
+        self._pending: Optional[MigrationJob] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, db_manager: DatabaseManager) -> "MigrationScheduler":
+        return cls(
+            db_manager,
+            interval=float(os.getenv("MIGRATION_INTERVAL", "60")),
+            chunk_size=int(os.getenv("MIGRATION_CHUNK_SIZE", "100")),
+            upload_concurrency=int(os.getenv("MIGRATION_UPLOAD_CONCURRENCY", "8")),
+            lock_id=int(os.getenv("MIGRATION_LOCK_ID", str(MIGRATION_LOCK_ID))),
+            image_storage=os.getenv("IMAGE_DATA_STORAGE", "inline"),
+        )
+
+    def start(self):
+        """Starts the scheduler loop on the running event loop."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="migration-scheduler")
+
+    @property
+    def running(self) -> bool:
+        """Whether the scheduler loop is alive (started, not stopped, not crashed)."""
+        return self._task is not None and not self._task.done()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # nothing will pick up a queued job anymore
+        if self._pending is not None:
+            self._pending.finish("cancelled", "migration scheduler stopped")
+            self._pending = None
+
+    def trigger(self) -> MigrationJob:
+        """Queues a run (or returns the one already queued) and wakes the scheduler."""
+        if self._pending is None:
+            self._pending = self._add_job("trigger")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return self._pending
+
+    def get(self, job_id: str) -> Optional[MigrationJob]:
+        return self.jobs.get(job_id)
+
+    def _add_job(self, trigger: str) -> MigrationJob:
+        job = MigrationJob(trigger)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.history:
+            self.jobs.popitem(last=False)
+        return job
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval or None)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            job, self._pending = self._pending or self._add_job("interval"), None
+            try:
+                await self.run_job(job)
+            except asyncio.CancelledError:
+                job.finish("cancelled")
+                raise
+
+    @staticmethod
+    def _execute_scalar(connection, query: str, lock_id: int):
+        cursor = connection.cursor()
+        cursor.execute(query, (lock_id,))
+        value = cursor.fetchone()[0]
+        # advisory locks belong to the session, so don't keep a transaction open while migrating
+        connection.commit()
+        cursor.close()
+        return value
+
+    async def run_job(self, job: MigrationJob):
+        """
+        Runs one job if this instance wins the advisory lock. The lock is held on its own
+        pooled connection for the whole drain; PostgreSQL releases it by itself if this
+        instance dies, so a crashed leader never blocks the others.
+        """
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        try:
+            async with self.db_manager.postgres.async_connection() as connection:
+                self.leader = await asyncio.to_thread(self._execute_scalar, connection, LOCK_QUERY, self.lock_id)
+                if not self.leader:
+                    job.finish("skipped", "another instance holds the migration lock")
+                    return
+                try:
+                    job.stats = await migrate_operations(
+                        self.db_manager, chunk_size=self.chunk_size, upload_concurrency=self.upload_concurrency,
+                        progress=job.update, image_storage=self.image_storage,
+                    )
+                finally:
+                    if not connection.closed:
+                        await asyncio.to_thread(self._execute_scalar, connection, UNLOCK_QUERY, self.lock_id)
+            job.finish("succeeded")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Migration job {job.id} failed: {e}")
+            job.finish("failed", str(e))
+
+    def stats(self) -> Dict:
+        recent = list(self.jobs.values())[-10:]
+        return {
+            "interval": self.interval,
+            "scheduler_running": self.running,
+            "chunk_size": self.chunk_size,
+            "image_storage": self.image_storage,
+            # whether this instance held the lock on its last run
+            "leader": self.leader,
+            "running": any(job.status == "running" for job in recent),
+            "jobs": [job.to_dict() for job in reversed(recent)],
+        }
@@ -0,0 +1,226 @@
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy
+
+import config  # noqa: F401  (loads .env)
+from inference_backends import load_model
+from metrics import model_inference_images, model_inference_seconds, model_inferences
+
+DEFAULT_MODEL_PATH = "YOLOv8-str-flower-model.pt"
+DEFAULT_MODEL_NAME = "default"
+
+
+def parse_model_config(value: Optional[str]) -> Dict[str, str]:
+    """
+    Parses a "name=path,name2=path2" model list (e.g. from YOLO_MODELS).
+    A bare path is registered under its file name without the extension.
+    """
+    if not value:
+        return {DEFAULT_MODEL_NAME: DEFAULT_MODEL_PATH}
+
+    models = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "=" in item:
+            name, path = item.split("=", 1)
+        else:
+            path = item
+            name = os.path.splitext(os.path.basename(item))[0]
+        models[name.strip()] = path.strip()
+    return models
+
+
+class ModelEntry:
+    """A loaded model plus the metadata reported by /models."""
+
+    def __init__(self, name: str, path: str, model, mtime: Optional[float], load_time_ms: float):
+        self.name = name
+        self.path = path
+        self.model = model
+        self.mtime = mtime
+        self.load_time_ms = load_time_ms
+        self.warmup_ms: Optional[float] = None
+        self.loaded_at = time.time()
+        self.memory_bytes = _model_memory_bytes(model, path)
+        # ultralytics predictors keep per-call state, so calls on one model are serialized;
+        # ONNX Runtime / OpenVINO models are thread safe and skip the lock
+        self.lock = contextlib.nullcontext() if getattr(model, "thread_safe", False) else threading.Lock()
+
+    def predict(self, source, **kwargs):
+        with self.lock:
+            with model_inference_seconds.time(model=self.name):
+                results = self.model(source, **kwargs)
+        model_inferences.inc(model=self.name)
+        model_inference_images.inc(len(source) if isinstance(source, list) else 1, model=self.name)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "backend": type(self.model).__name__,
+            "loaded_at": self.loaded_at,
+            "load_time_ms": round(self.load_time_ms, 2),
+            "warmup_ms": None if self.warmup_ms is None else round(self.warmup_ms, 2),
+            "memory_bytes": self.memory_bytes,
+        }
+
+
+def _model_memory_bytes(model, path: str) -> int:
+    """Size of the model tensors, falling back to the weights file size."""
+    try:
+        torch_model = model.model
+        total = sum(p.numel() * p.element_size() for p in torch_model.parameters())
+        total += sum(b.numel() * b.element_size() for b in torch_model.buffers())
+        return int(total)
+    except Exception:
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of YOLO models.
+
+    Weights are loaded once, warmed up on a dummy frame and shared by every request.
+    When a weights file changes on disk the new version is loaded and warmed up in
+    the background and swapped in, so requests keep using the old model until then.
+    """
+
+    def __init__(self, models: Dict[str, str], default: Optional[str] = None,
+                 warmup_size: int = 640, reload_interval: float = 30.0, backend: str = "auto"):
+        self.paths = dict(models)
+        self.backend = backend
+        self.default = default or next(iter(self.paths), DEFAULT_MODEL_NAME)
+        self.warmup_size = warmup_size
+        self.reload_interval = reload_interval
+        self._entries: Dict[str, ModelEntry] = {}
+        self._load_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls) -> "ModelRegistry":
+        return cls(
+            parse_model_config(os.getenv("YOLO_MODELS")),
+            default=os.getenv("YOLO_DEFAULT_MODEL"),
+            warmup_size=int(os.getenv("YOLO_WARMUP_SIZE", "640")),
+            reload_interval=float(os.getenv("YOLO_RELOAD_INTERVAL", "30")),
+            backend=os.getenv("YOLO_BACKEND", "auto"),
+        )
+
+    def _load(self, name: str) -> ModelEntry:
+        path = self.paths[name]
+        if not os.path.exists(path):
+            raise FileNotFoundError("Model file not found")
+
+        mtime = os.path.getmtime(path)
+        start = time.perf_counter()
+        model = load_model(path, self.backend)
+        entry = ModelEntry(name, path, model, mtime, (time.perf_counter() - start) * 1000)
+
+        # run one inference so the first real request doesn't pay for lazy setup
+        dummy = numpy.zeros((self.warmup_size, self.warmup_size, 3), dtype=numpy.uint8)
+        start = time.perf_counter()
+        entry.predict(dummy, verbose=False)
+        entry.warmup_ms = (time.perf_counter() - start) * 1000
+
+        logging.info(f"Loaded model '{name}' from {path} in {entry.load_time_ms:.0f} ms "
+                     f"(warm-up {entry.warmup_ms:.0f} ms)")
+        return entry
+
+    def load_all(self):
+        """Loads every configured model, logging (not raising) on missing files."""
+        for name in self.paths:
+            try:
+                self.get(name)
+            except Exception as e:
+                logging.error(f"Failed to load model '{name}': {e}")
+
+    def get(self, name: Optional[str] = None) -> ModelEntry:
+        """Returns the loaded model, loading it on first use."""
+        name = name or self.default
+        if name not in self.paths:
+            raise ValueError(f"Unknown model '{name}'. Available models: {', '.join(self.paths)}")
+
+        entry = self._entries.get(name)
+        if entry is not None:
+            return entry
+
+        with self._load_lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._load(name)
+                self._entries[name] = entry
+            return entry
+
+    def register(self, name: str, model, path: Optional[str] = None) -> ModelEntry:
+        """
+        Installs an already constructed model (e.g. a stub for benchmarks) under `name`.
+        Registered models have no weights file to watch and are never reloaded.
+        """
+        path = path or f"<{type(model).__name__}>"
+        entry = ModelEntry(name, path, model, None, 0.0)
+        with self._load_lock:
+            self.paths[name] = path
+            self._entries[name] = entry
+        return entry
+
+    def is_loaded(self, name: Optional[str] = None) -> bool:
+        return (name or self.default) in self._entries
+
+    def version(self, name: Optional[str] = None) -> str:
+        """Identifies the weights a request would use, without loading them."""
+        name = name or self.default
+        if name not in self.paths:
+            raise ValueError(f"Unknown model '{name}'. Available models: {', '.join(self.paths)}")
+        path = self.paths[name]
+        mtime = os.path.getmtime(path) if os.path.exists(path) else 0
+        return f"{name}@{mtime}"
+
+    def reload_changed(self):
+        """Reloads every loaded model whose weights file has a new mtime."""
+        for name, entry in list(self._entries.items()):
+            if entry.mtime is None:
+                continue
+            try:
+                if os.path.getmtime(entry.path) == entry.mtime:
+                    continue
+                new_entry = self._load(name)
+                self._entries[name] = new_entry
+                logging.info(f"Reloaded model '{name}' after weights file changed")
+            except Exception as e:
+                logging.error(f"Failed to reload model '{name}', keeping previous version: {e}")
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            self.reload_changed()
+
+    def start_watcher(self):
+        if self.reload_interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-reload", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        self._watcher = None
+
+    def stats(self) -> dict:
+        models = {}
+        for name, path in self.paths.items():
+            entry = self._entries.get(name)
+            models[name] = entry.stats() if entry else {"path": path, "loaded_at": None}
+        return {"default": self.default, "models": models}
+
+
+# Process-wide instance, built once from the environment at import. The other services
+# (detection pool, inference scheduler, cascade, result cache, blob uploads) follow the
+# same pattern: one module-level instance that every request and module imports.
+model_registry = ModelRegistry.from_env()
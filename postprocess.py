@@ -0,0 +1,102 @@
+from typing import List, Optional, Sequence
+
+import numpy
+
+# coordinate sort keys accepted by the detection routes ("confidence" sorts highest first)
+SORT_KEYS = ("x", "y", "confidence")
+
+
+def box_iou(a: numpy.ndarray, b: numpy.ndarray) -> numpy.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes."""
+    top_left = numpy.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = numpy.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = (bottom_right - top_left).clip(0).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return intersection / numpy.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def nms(boxes: numpy.ndarray, scores: numpy.ndarray, iou_threshold: float) -> numpy.ndarray:
+    """
+    Greedy non-maximum suppression.
+    :param boxes: (N, 4) array of x_min, y_min, x_max, y_max.
+    :param scores: (N,) confidence scores.
+    :return: Indices of the kept boxes, highest score first.
+    """
+    if len(boxes) == 0:
+        return numpy.empty(0, dtype=numpy.int64)
+
+    boxes = boxes.astype(numpy.float64, copy=False)
+    areas = (boxes[:, 2] - boxes[:, 0]).clip(0) * (boxes[:, 3] - boxes[:, 1]).clip(0)
+    order = numpy.argsort(-scores, kind="stable")
+    keep = []
+
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+
+        # intersection of the best box with every remaining box at once
+        width = (numpy.minimum(boxes[best, 2], boxes[rest, 2]) - numpy.maximum(boxes[best, 0], boxes[rest, 0])).clip(0)
+        height = (numpy.minimum(boxes[best, 3], boxes[rest, 3]) - numpy.maximum(boxes[best, 1], boxes[rest, 1])).clip(0)
+        intersection = width * height
+        iou = intersection / numpy.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[iou <= iou_threshold]
+
+    return numpy.asarray(keep, dtype=numpy.int64)
+
+
+def postprocess_boxes(boxes: numpy.ndarray, confidences: numpy.ndarray, classes: Optional[numpy.ndarray],
+                      width: int, height: int, sort_key: str = "y", min_conf: float = 0.0,
+                      top_k: Optional[int] = None, class_ids: Optional[Sequence[int]] = None,
+                      iou: Optional[float] = None):
+    """
+    Filters, de-duplicates and sorts raw model boxes with array operations only.
+
+    :param boxes: (N, 4) pixel boxes x_min, y_min, x_max, y_max.
+    :param confidences: (N,) confidence scores.
+    :param classes: (N,) class ids, or None when the model has a single class.
+    :param width: Image width used to normalize the centers.
+    :param height: Image height used to normalize the centers.
+    :param sort_key: "x", "y" or "confidence".
+    :param min_conf: Drop boxes below this confidence.
+    :param top_k: Keep only the k most confident boxes.
+    :param class_ids: Keep only these class ids.
+    :param iou: Extra NMS pass at this IoU threshold (None skips it).
+    :return: (kept_boxes, kept_confidences, normalized_coords) in sorted order.
+    """
+    if sort_key not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key '{sort_key}', use one of: {', '.join(SORT_KEYS)}")
+
+    boxes = numpy.asarray(boxes, dtype=numpy.float64).reshape(-1, 4)
+    confidences = numpy.asarray(confidences, dtype=numpy.float64).reshape(-1)
+
+    keep = confidences >= min_conf
+    if class_ids is not None and classes is not None:
+        keep &= numpy.isin(numpy.asarray(classes).astype(numpy.int64), list(class_ids))
+    boxes, confidences = boxes[keep], confidences[keep]
+
+    if iou is not None:
+        order = nms(boxes, confidences, iou)
+        boxes, confidences = boxes[order], confidences[order]
+
+    if top_k is not None and len(confidences) > top_k:
+        order = numpy.argsort(-confidences, kind="stable")[:top_k]
+        boxes, confidences = boxes[order], confidences[order]
+
+    # centers normalized by the image size
+    xs = numpy.round((boxes[:, 0] + boxes[:, 2]) / 2 / width, 4)
+    ys = numpy.round((boxes[:, 1] + boxes[:, 3]) / 2 / height, 4)
+    rounded_conf = numpy.round(confidences, 2)
+
+    if sort_key == "confidence":
+        order = numpy.argsort(-confidences, kind="stable")
+    else:
+        order = numpy.argsort(xs if sort_key == "x" else ys, kind="stable")
+
+    boxes, confidences = boxes[order], confidences[order]
+    normalized_coords: List[dict] = [
+        {"x": x, "y": y, "confidence": c}
+        for x, y, c in zip(xs[order].tolist(), ys[order].tolist(), rounded_conf[order].tolist())
+    ]
+    return boxes, confidences, normalized_coords
@@ -0,0 +1,128 @@
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy
+
+import config  # noqa: F401  (loads .env)
+from image_io import decode_image_bytes, image_dimensions, image_format
+
+# when JPEGs are decoded at reduced resolution: "auto" where the response doesn't draw on
+# the full frame (CV routes, YOLO format=coords), "always" or "off"
+REDUCED_DECODE_MODES = ("auto", "always", "off")
+REDUCED_DECODE = os.getenv("REDUCED_DECODE", "auto")
+if REDUCED_DECODE not in REDUCED_DECODE_MODES:
+    raise ValueError(f"Unknown REDUCED_DECODE '{REDUCED_DECODE}', use one of: {', '.join(REDUCED_DECODE_MODES)}")
+# YOLO input size, the smallest longer side a reduced decode may produce for the model
+YOLO_INPUT_SIZE = int(os.getenv("YOLO_INPUT_SIZE", "640"))
+
+# largest reduction first
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def reduced_decode_side(target_side: int, full_frame_output: bool = False) -> int:
+    """
+    :param target_side: Longer side the consumer works at (CV_MAX_SIDE, YOLO_INPUT_SIZE).
+    :param full_frame_output: The response draws on the decoded frame.
+    :return: target_side for decode_for_size, or 0 (full resolution) under the REDUCED_DECODE mode.
+    """
+    if REDUCED_DECODE == "off" or (REDUCED_DECODE == "auto" and full_frame_output):
+        return 0
+    return target_side
+
+
+def reduction_factor(width: int, height: int, target_side: int) -> int:
+    """Largest JPEG reduction (8, 4, 2 or 1) that keeps the longer side at least target_side."""
+    if target_side <= 0:
+        return 1
+    for factor, _ in _REDUCED_FLAGS:
+        # libjpeg rounds scaled sizes up
+        if -(-max(width, height) // factor) >= target_side:
+            return factor
+    return 1
+
+
+def decode_for_size(data: bytes, target_side: int = 0):
+    """
+    Decodes only the pixels a consumer working at target_side needs.
+
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale straight from the DCT coefficients
+    (IMREAD_REDUCED_COLOR_*), which skips most of the IDCT work and the full-size
+    buffer. Other formats, and target_side=0, decode at full resolution.
+
+    :return: (image, factor, (width, height)): factor is original pixels per decoded pixel,
+             (width, height) the original size. image is None when the bytes aren't readable.
+    """
+    dimensions = image_dimensions(data) if target_side and image_format(data) == "jpeg" else None
+    factor = reduction_factor(*dimensions, target_side) if dimensions else 1
+    if factor == 1:
+        image = decode_image_bytes(data)
+        if image is None:
+            return None, 1, None
+        return image, 1, (image.shape[1], image.shape[0])
+
+    flag = dict(_REDUCED_FLAGS)[factor]
+    image = cv2.imdecode(numpy.frombuffer(data, numpy.uint8), flag)
+    if image is None:
+        return None, 1, None
+    width, height = dimensions
+    # the header holds the stored size; EXIF orientation may have rotated the decoded frame
+    if (image.shape[1] > image.shape[0]) != (width > height) and width != height:
+        width, height = height, width
+    return image, factor, (width, height)
+
+
+def to_original(boxes: numpy.ndarray, factor: int, size: Tuple[int, int]) -> numpy.ndarray:
+    """Maps xyxy boxes in decoded pixels back to original-frame pixels."""
+    if factor == 1:
+        return boxes
+    width, height = size
+    return numpy.minimum(numpy.asarray(boxes, numpy.float64) * factor, (width, height, width, height))
+
+
+class _LetterboxBuffers(threading.local):
+    canvas: Optional[numpy.ndarray] = None
+    blob: Optional[numpy.ndarray] = None
+
+
+_buffers = _LetterboxBuffers()
+
+
+def letterbox_blob(frames: List[numpy.ndarray], size: int, color: int = 114):
+    """
+    Letterboxes frames into a normalized float32 NCHW RGB batch, like letterbox + to_blob
+    in inference_backends but without per-frame allocations: each frame is resized straight
+    into a padded canvas and converted channel by channel into the batch, both buffers
+    reused by the calling thread across requests.
+
+    The blob is overwritten by the thread's next call, so use it before calling again.
+
+    :return: (blob, [(gain, (pad_left, pad_top)) per frame]).
+    """
+    if _buffers.canvas is None or _buffers.canvas.shape[0] != size:
+        _buffers.canvas = numpy.empty((size, size, 3), numpy.uint8)
+        _buffers.blob = None
+    if _buffers.blob is None or _buffers.blob.shape[0] < len(frames):
+        _buffers.blob = numpy.empty((len(frames), 3, size, size), numpy.float32)
+    canvas, blob = _buffers.canvas, _buffers.blob[:len(frames)]
+
+    transforms = []
+    for index, frame in enumerate(frames):
+        height, width = frame.shape[:2]
+        gain = min(size / height, size / width)
+        new_width, new_height = int(round(width * gain)), int(round(height * gain))
+        top, left = int(round((size - new_height) / 2 - 0.1)), int(round((size - new_width) / 2 - 0.1))
+
+        canvas.fill(color)
+        target = canvas[top:top + new_height, left:left + new_width]
+        if (new_width, new_height) != (width, height):
+            cv2.resize(frame, (new_width, new_height), dst=target, interpolation=cv2.INTER_LINEAR)
+        else:
+            target[...] = frame
+
+        # BGR -> RGB and 0-255 -> 0-1 in one pass per channel
+        for channel in range(3):
+            numpy.divide(canvas[:, :, 2 - channel], numpy.float32(255), out=blob[index, channel], casting="unsafe")
+        transforms.append((gain, (left, top)))
+    return blob, transforms
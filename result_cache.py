@@ -0,0 +1,180 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import config  # noqa: F401  (loads .env)
+
+
+class ResultCache:
+    """
+    LRU cache of detection responses keyed by image content and parameters.
+
+    The in-memory tier is bounded by total (JSON encoded) size and a TTL. With disk_dir
+    set, entries are also written there so they survive restarts; disk entries
+    expire by file age using the same TTL. Entries are stored as JSON, never pickle,
+    so whoever can write to disk_dir can't make the API process run code.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            max_bytes=int(float(os.getenv("RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024),
+            ttl=float(os.getenv("RESULT_CACHE_TTL", "300")),
+            disk_dir=os.getenv("RESULT_CACHE_DIR") or None,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or bool(self.disk_dir)
+
+    @staticmethod
+    def make_key(data: bytes, namespace: str, params: dict) -> str:
+        """Hash of the decoded image bytes plus model version and request parameters."""
+        digest = hashlib.sha256(data)
+        digest.update(namespace.encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        def default(item):
+            # raw image bytes (format=binary responses) and numpy scalars
+            if isinstance(item, (bytes, bytearray)):
+                return {"$bytes": base64.b64encode(item).decode("ascii")}
+            if hasattr(item, "tolist"):
+                return item.tolist()
+            raise TypeError(f"{type(item).__name__} can't be cached")
+        return json.dumps(value, default=default, separators=(",", ":")).encode()
+
+    @staticmethod
+    def _decode(payload: bytes) -> Any:
+        def object_hook(item: dict):
+            if len(item) == 1 and "$bytes" in item:
+                return base64.b64decode(item["$bytes"])
+            return item
+        return json.loads(payload, object_hook=object_hook)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, size, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self._size -= size
+                self.expirations += 1
+
+        if self.disk_dir:
+            value = self._read_disk(key, now)
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._put_memory(key, value, self._encode(value))
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _read_disk(self, key: str, now: float) -> Optional[Any]:
+        path = self._disk_path(key)
+        try:
+            if now - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return self._decode(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Dropping unreadable cache entry {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def put(self, key: str, value: Any):
+        try:
+            payload = self._encode(value)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Not caching result: {e}")
+            return
+        self._put_memory(key, value, payload)
+        if self.disk_dir:
+            self._write_disk(key, payload)
+
+    def _put_memory(self, key: str, value: Any, payload: bytes):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (time.time() + self.ttl, size, value)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def _write_disk(self, key: str, payload: bytes):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write then rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Failed to write cache entry to disk: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "disk_dir": self.disk_dir,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+result_cache = ResultCache.from_env()
@@ -0,0 +1,60 @@
+import os
+from typing import Dict, List, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+
+import config  # noqa: F401  (loads .env)
+from database import PostgresManager
+
+# rovers per INSERT statement of a bulk registration (all statements share one transaction)
+BULK_PAGE_SIZE = int(os.getenv("ROVERS_BULK_PAGE_SIZE", "1000"))
+
+# input_order sorts the SELECT, so the sequence hands out rover_ids in input order
+BULK_INSERT_QUERY = """
+INSERT INTO rovers (initial_id, rover_status, user_id)
+SELECT initial_id, rover_status, user_id
+FROM (VALUES %s) AS input (input_order, initial_id, rover_status, user_id)
+ORDER BY input_order{conflict}
+RETURNING rover_id, created_at, initial_id, (xmax = 0) AS inserted;
+"""
+
+# needs a unique index on rovers.initial_id
+UPSERT_CLAUSE = """
+ON CONFLICT (initial_id) DO UPDATE SET rover_status = EXCLUDED.rover_status, user_id = EXCLUDED.user_id"""
+
+
+def insert_rovers(postgres: PostgresManager, rovers: Sequence[Tuple[int, int, int]], upsert: bool = False,
+                  page_size: int = BULK_PAGE_SIZE) -> List[Dict]:
+    """
+    Registers many rovers in one transaction with multi-row INSERTs (execute_values),
+    all or nothing.
+
+    RETURNING order isn't guaranteed by PostgreSQL, so results are put back in input
+    order explicitly: new rows by their rover_id, upserted rows by their initial_id.
+    With upsert=True, rovers whose initial_id already exists are updated instead, and an
+    initial_id repeated in the input is written once with its last values.
+
+    :param rovers: (initial_id, rover_status, user_id) per rover.
+    :return: {"rover_id", "created_at"} per input rover (plus "inserted" with upsert), in input order.
+    """
+    if upsert:
+        # one statement can't update the same row twice
+        latest = {initial_id: position for position, (initial_id, _, _) in enumerate(rovers)}
+        values = [(position, *rovers[position]) for position in sorted(latest.values())]
+    else:
+        values = [(position, *rover) for position, rover in enumerate(rovers)]
+
+    query = BULK_INSERT_QUERY.format(conflict=UPSERT_CLAUSE if upsert else "")
+    with postgres.connection() as connection:
+        with connection.cursor() as cursor:
+            returned = execute_values(cursor, query, values, page_size=page_size, fetch=True)
+        connection.commit()
+
+    if upsert:
+        by_initial_id = {initial_id: {"rover_id": rover_id, "created_at": created_at, "inserted": inserted}
+                         for rover_id, created_at, initial_id, inserted in returned}
+        return [by_initial_id[initial_id] for initial_id, _, _ in rovers]
+
+    # pages run in order and each inserts in position order, so rover_ids follow the input
+    returned.sort(key=lambda row: row[0])
+    return [{"rover_id": rover_id, "created_at": created_at} for rover_id, created_at, _, _ in returned]
@@ -0,0 +1,158 @@
+import asyncio
+import base64
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from detection_executor import ExecutorBusy
+
+
+class StreamSession:
+    """Counters and latency samples of one live detection stream."""
+
+    def __init__(self, client: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.client = client
+        self.started_at = time.time()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        # frames rejected because the detection pool was full
+        self.busy = 0
+        self._latencies = deque(maxlen=500)
+        self._completed_at = deque(maxlen=500)
+
+    def record(self, latency_ms: float):
+        self.processed += 1
+        self._latencies.append(latency_ms)
+        self._completed_at.append(time.perf_counter())
+
+    def fps(self, window: float = 5.0) -> float:
+        now = time.perf_counter()
+        recent = [t for t in self._completed_at if now - t <= window]
+        if len(recent) < 2:
+            return 0.0
+        return round((len(recent) - 1) / max(recent[-1] - recent[0], 1e-6), 2)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "id": self.id,
+            "client": self.client,
+            "started_at": self.started_at,
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "busy": self.busy,
+            "fps": self.fps(),
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                "p50": round(latencies[len(latencies) // 2], 2) if latencies else None,
+                "p95": round(latencies[int(len(latencies) * 0.95)], 2) if latencies else None,
+            },
+        }
+
+
+# streams currently connected to this process
+active_streams: Dict[str, StreamSession] = {}
+
+
+def decode_frame(message: dict) -> Optional[bytes]:
+    """Binary messages are encoded images; text messages are base64 or a data URL."""
+    if message.get("bytes") is not None:
+        return message["bytes"]
+    text = message.get("text")
+    if text:
+        return base64.b64decode(text.split(",")[-1])
+    return None
+
+
+async def run_detection_stream(websocket: WebSocket, detect: Callable[[bytes], Awaitable[dict]]):
+    """
+    Runs detection over a continuous stream of frames on one WebSocket.
+
+    Frames are read as fast as the client sends them, but only the newest one waits
+    for the detector: if the detector is still busy when a new frame arrives, the
+    waiting frame is dropped. This keeps latency bounded instead of queueing up a
+    backlog. Each result is pushed back as JSON as soon as it completes.
+    """
+    await websocket.accept()
+    client = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else "unknown"
+    session = StreamSession(client)
+    active_streams[session.id] = session
+
+    pending: Optional[Tuple[int, bytes, float]] = None
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        nonlocal pending
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            received_at = time.perf_counter()
+            session.received += 1
+            try:
+                data = decode_frame(message)
+            except Exception:
+                data = None
+            if not data:
+                session.failed += 1
+                await websocket.send_json({"frame": session.received, "status": 400, "error": "Invalid frame"})
+                continue
+            if pending is not None:
+                session.dropped += 1
+            pending = (session.received, data, received_at)
+            frame_ready.set()
+
+    async def process_frames():
+        nonlocal pending
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if pending is None:
+                continue
+            frame, data, received_at = pending
+            pending = None
+
+            try:
+                result = await detect(data)
+            except ExecutorBusy as e:
+                # not the frame's fault: like the HTTP routes' 503, the rover should back off and retry
+                session.busy += 1
+                await websocket.send_json({"frame": frame, "status": 503, "error": str(e),
+                                           "retry_after": e.retry_after})
+                continue
+            except Exception as e:
+                session.failed += 1
+                await websocket.send_json({"frame": frame, "status": 400, "error": str(e)})
+                continue
+
+            latency_ms = (time.perf_counter() - received_at) * 1000
+            session.record(latency_ms)
+            await websocket.send_json({
+                "frame": frame,
+                "status": 200,
+                "imageResult": result["imageResult"],
+                "latency_ms": round(latency_ms, 2),
+                "dropped": session.dropped,
+            })
+
+    tasks = [asyncio.create_task(receive_frames()), asyncio.create_task(process_frames())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                logging.error(f"Detection stream {session.id} failed: {error}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        active_streams.pop(session.id, None)
+        logging.info(f"Detection stream {session.id} closed: {session.stats()}")
@@ -0,0 +1,144 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+
+from database import DatabaseManager
+from metrics import db_call_seconds
+
+# fields a telemetry read can return (inline image_data is never read back, "image" is the offloaded frame reference)
+TELEMETRY_FIELDS = ("id", "random_id", "battery_status", "temp", "humidity", "blob_url", "image")
+# numeric fields that can be downsampled
+NUMERIC_FIELDS = ("battery_status", "temp", "humidity")
+# $dateTrunc units accepted by the downsampling query
+BUCKET_UNITS = ("minute", "hour", "day", "week", "month")
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """:param fields: Comma separated field names, None for all allowed fields."""
+    if not fields:
+        return list(allowed)
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s) {', '.join(unknown)}, use: {', '.join(allowed)}")
+    return names
+
+
+def encode_cursor(created_at: datetime, document_id) -> str:
+    """Opaque cursor pointing just past the given document."""
+    raw = f"{created_at.isoformat()}|{document_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """:return: (created_at, _id) of the last document of the previous page."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, document_id = raw.split("|", 1)
+        created_at = datetime.fromisoformat(created_at)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+    try:
+        document_id = ObjectId(document_id)
+    except InvalidId:
+        pass
+    return created_at, document_id
+
+
+def time_range(rover_id: int, start: Optional[datetime], end: Optional[datetime]) -> Dict:
+    """Filter on one rover and an optional [start, end) time range."""
+    query: Dict = {"rover_id": rover_id}
+    if start or end:
+        query["created_at"] = {}
+        if start:
+            query["created_at"]["$gte"] = start
+        if end:
+            query["created_at"]["$lt"] = end
+    return query
+
+
+async def query_telemetry(db_manager: DatabaseManager, rover_id: int, start: Optional[datetime] = None,
+                          end: Optional[datetime] = None, fields: Optional[List[str]] = None, limit: int = 100,
+                          cursor: Optional[str] = None, order: str = "asc",
+                          collection_name: str = "operations") -> Dict:
+    """
+    One page of a rover's telemetry, ordered by time.
+
+    Pages are keyset-paginated on (created_at, _id), which the rover_created_at index
+    serves directly, so every page costs the same no matter how deep it is.
+
+    :return: {"items": [...], "next_cursor": str or None}.
+    """
+    query = time_range(rover_id, start, end)
+    direction = ASCENDING if order == "asc" else DESCENDING
+    if cursor:
+        created_at, document_id = decode_cursor(cursor)
+        after = "$gt" if direction == ASCENDING else "$lt"
+        query["$or"] = [
+            {"created_at": {after: created_at}},
+            {"created_at": created_at, "_id": {after: document_id}},
+        ]
+
+    projection = {"_id": 1, "rover_id": 1, "created_at": 1, **{field: 1 for field in fields or TELEMETRY_FIELDS}}
+    collection = db_manager.mongo_manager.db[collection_name]
+    with db_call_seconds.time(database="mongo", operation="find"):
+        # one extra document tells whether there is a next page
+        documents = await collection.find(query, projection) \
+            .sort([("created_at", direction), ("_id", direction)]) \
+            .limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1]["created_at"], documents[-1]["_id"])
+    for document in documents:
+        document["_id"] = str(document["_id"])
+    return {"items": documents, "next_cursor": next_cursor}
+
+
+async def downsample_telemetry(db_manager: DatabaseManager, rover_id: int, start: Optional[datetime] = None,
+                               end: Optional[datetime] = None, fields: Optional[List[str]] = None,
+                               unit: str = "hour", bin_size: int = 1, max_buckets: int = 1000,
+                               collection_name: str = "operations") -> List[Dict]:
+    """
+    Averages, minimums and maximums of the numeric fields per time bucket, computed by
+    MongoDB ($dateTrunc, MongoDB 5.0+) so only the buckets leave the database.
+
+    :return: [{"start": bucket start, "count": documents, "<field>": {"avg", "min", "max"}}, ...].
+    """
+    if unit not in BUCKET_UNITS:
+        raise ValueError(f"Unknown bucket unit '{unit}', use one of: {', '.join(BUCKET_UNITS)}")
+    fields = fields or list(NUMERIC_FIELDS)
+
+    group: Dict = {
+        "_id": {"$dateTrunc": {"date": "$created_at", "unit": unit, "binSize": bin_size}},
+        "count": {"$sum": 1},
+    }
+    for field in fields:
+        group[f"{field}_avg"] = {"$avg": f"${field}"}
+        group[f"{field}_min"] = {"$min": f"${field}"}
+        group[f"{field}_max"] = {"$max": f"${field}"}
+
+    pipeline = [
+        {"$match": time_range(rover_id, start, end)},
+        {"$group": group},
+        {"$sort": {"_id": 1}},
+        {"$limit": max_buckets},
+    ]
+    collection = db_manager.mongo_manager.db[collection_name]
+    with db_call_seconds.time(database="mongo", operation="aggregate"):
+        buckets = await collection.aggregate(pipeline).to_list(length=max_buckets)
+
+    return [
+        {
+            "start": bucket["_id"],
+            "count": bucket["count"],
+            **{field: {stat: bucket[f"{field}_{stat}"] for stat in ("avg", "min", "max")} for field in fields},
+        }
+        for bucket in buckets
+    ]
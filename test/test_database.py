@@ -0,0 +1,67 @@
+"""PostgresManager pool bookkeeping with psycopg2.connect replaced by an in-memory fake."""
+import psycopg2.pool
+import pytest
+from psycopg2 import extensions
+
+from database import PostgresManager
+
+
+class FakeInfo:
+    transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    def __init__(self, *args, **kwargs):
+        self.closed = 0
+        self.info = FakeInfo()
+        self.broken = False
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def postgres(monkeypatch):
+    monkeypatch.setattr(psycopg2.pool.psycopg2, "connect", FakeConnection)
+    manager = PostgresManager()
+    manager.connect("postgresql://fake", pool_size=2, max_overflow=1, timeout=0.1)
+    yield manager
+    manager.close()
+
+
+def test_failed_rollback_discards_the_connection_and_frees_the_slot(postgres):
+    # more failures than the pool has slots: each must hand its slot back
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            with postgres.connection() as connection:
+                connection.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+                connection.broken = True
+                raise ValueError("query failed")
+        assert connection.closed
+
+    assert postgres.stats()["in_use"] == 0
+    with postgres.connection() as connection:
+        assert not connection.closed
+
+
+def test_idle_count_follows_the_pool(postgres):
+    with postgres.connection():
+        with postgres.connection():
+            with postgres.connection():
+                stats = postgres.stats()
+                assert (stats["in_use"], stats["idle"]) == (3, 0)
+    # the overflow connection is closed again
+    assert postgres.stats()["idle"] == 2
+    assert len(postgres.pool._pool) == 2
+
+
+def test_timeout_when_every_slot_is_taken(postgres):
+    with postgres.connection(), postgres.connection(), postgres.connection():
+        with pytest.raises(RuntimeError, match="Timed out"):
+            with postgres.connection():
+                pass
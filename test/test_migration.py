@@ -0,0 +1,172 @@
+"""
+migrate_chunk against in-memory PostgreSQL / MongoDB / blob fakes: a chunk that fails
+partway and is replayed must end with every row in MongoDB exactly once.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+import migration
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+
+    def execute(self, query, params):
+        table = self.connection.postgres.rows
+        if query == migration.CLAIM_CHUNK_QUERY:
+            rows = sorted(table.values(), key=lambda row: row["created_at"])[:params[0]]
+            self.result = [tuple(row[column] for column in migration.OPERATION_COLUMNS) for row in rows]
+        elif query == migration.DELETE_CHUNK_QUERY:
+            self.connection.deleted.update(params[0])
+            if self.connection.postgres.fail_delete:
+                self.connection.postgres.fail_delete = False
+                raise ConnectionError("server closed the connection")
+        else:
+            raise AssertionError(f"unexpected query {query}")
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, postgres):
+        self.postgres = postgres
+        # deletes only become visible on commit, like a transaction
+        self.deleted = set()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        for row_id in self.deleted:
+            del self.postgres.rows[row_id]
+        self.deleted = set()
+
+    def rollback(self):
+        self.deleted = set()
+
+
+class FakePostgres:
+    def __init__(self, rows):
+        self.rows = {row["id"]: row for row in rows}
+        self.fail_delete = False
+
+    @asynccontextmanager
+    async def async_connection(self):
+        connection = FakeConnection(self)
+        try:
+            yield connection
+        except BaseException:
+            connection.rollback()
+            raise
+
+
+class FakeDatabaseManager:
+    """Mongo side with the unique index on the row id: duplicates are skipped, like add_many_to_mongo."""
+
+    def __init__(self, rows):
+        self.postgres = FakePostgres(rows)
+        self.documents = {}
+        self.inserted = 0
+        # the next bulk write stores this many documents and then fails
+        self.fail_after = None
+
+    async def ensure_indexes(self):
+        pass
+
+    async def add_many_to_mongo(self, documents):
+        for index, document in enumerate(documents):
+            if self.fail_after is not None and index == self.fail_after:
+                self.fail_after = None
+                raise RuntimeError("MongoDB write interrupted")
+            if document["id"] not in self.documents:
+                self.documents[document["id"]] = document
+                self.inserted += 1
+
+
+class FakeBlobService:
+    def __init__(self):
+        self.blobs = {}
+
+    async def upload_base64(self, data, file_extension, blob_name=None, deduplicate=None):
+        name = f"{blob_name}.{file_extension}"
+        self.blobs[name] = data
+        return f"https://blobs/{name}"
+
+
+def operation_rows(count):
+    start = datetime(2025, 1, 1)
+    return [{"id": row_id, "rover_id": 1, "random_id": row_id, "battery_status": 90, "temp": 20.5,
+             "humidity": 40.0, "result_image": f"data:image/png;base64,cmVzdWx0{row_id}",
+             "image_data": f"ZnJhbWU{row_id}", "created_at": start + timedelta(seconds=row_id)}
+            for row_id in range(1, count + 1)]
+
+
+@pytest.fixture
+def blobs(monkeypatch):
+    service = FakeBlobService()
+    monkeypatch.setattr(migration, "blob_service", service)
+    return service
+
+
+def test_chunk_failing_on_mongo_write_is_replayed_once(blobs):
+    db_manager = FakeDatabaseManager(operation_rows(10))
+    db_manager.fail_after = 3
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(migration.migrate_chunk(db_manager, 5, 2))
+    # nothing deleted, part of the chunk already in MongoDB
+    assert len(db_manager.postgres.rows) == 10
+    assert sorted(db_manager.documents) == [1, 2, 3]
+
+    stats = asyncio.run(migration.migrate_operations(db_manager, chunk_size=5))
+    assert stats["rows"] == 10
+    assert db_manager.postgres.rows == {}
+    assert sorted(db_manager.documents) == list(range(1, 11))
+    assert db_manager.inserted == 10
+    # blobs are named after the row, so the replay overwrote instead of adding
+    assert set(blobs.blobs) == {f"operations/{row_id}.jpeg" for row_id in range(1, 11)}
+
+
+def test_chunk_failing_on_delete_is_replayed_once(blobs):
+    db_manager = FakeDatabaseManager(operation_rows(7))
+    db_manager.postgres.fail_delete = True
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(migration.migrate_chunk(db_manager, 5, 2))
+    # the whole chunk reached MongoDB but the delete was rolled back
+    assert len(db_manager.postgres.rows) == 7
+    assert sorted(db_manager.documents) == [1, 2, 3, 4, 5]
+
+    asyncio.run(migration.migrate_operations(db_manager, chunk_size=5))
+    assert db_manager.postgres.rows == {}
+    assert sorted(db_manager.documents) == list(range(1, 8))
+    assert db_manager.inserted == 7
+    assert all(document["blob_url"] == f"https://blobs/operations/{row_id}.jpeg"
+               for row_id, document in db_manager.documents.items())
+
+
+def test_blob_storage_chunk_replay_keeps_one_reference_per_row(blobs, monkeypatch):
+    async def offload(payloads, concurrency=8):
+        return [{"url": f"https://blobs/{payload}", "sha256": payload} for payload in payloads]
+
+    monkeypatch.setattr(migration, "offload_image_payloads", offload)
+    db_manager = FakeDatabaseManager(operation_rows(4))
+    db_manager.fail_after = 1
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(migration.migrate_chunk(db_manager, 4, 2, image_storage="blob"))
+    asyncio.run(migration.migrate_operations(db_manager, chunk_size=4, image_storage="blob"))
+
+    assert db_manager.postgres.rows == {}
+    assert sorted(db_manager.documents) == [1, 2, 3, 4]
+    assert all("image_data" not in document and document["image"]["sha256"] == f"ZnJhbWU{row_id}"
+               for row_id, document in db_manager.documents.items())
@@ -0,0 +1,44 @@
+"""ResultCache memory and disk tiers."""
+import os
+import pickle
+
+from result_cache import ResultCache
+
+RESPONSE = {"status": 200, "imageResult": [{"x": 0.25, "y": 0.5, "confidence": 0.9}],
+            "image_bytes": b"\xff\xd8\x00jpeg\xff\xd9"}
+
+
+def test_disk_entry_survives_a_restart(tmp_path):
+    key = ResultCache.make_key(b"frame", "yolo:v1", {"output": "binary"})
+    ResultCache(disk_dir=str(tmp_path)).put(key, RESPONSE)
+
+    restarted = ResultCache(disk_dir=str(tmp_path))
+    assert restarted.get(key) == RESPONSE
+    assert restarted.stats()["disk_hits"] == 1
+    # served from memory afterwards
+    assert restarted.get(key) == RESPONSE
+    assert restarted.stats()["hits"] == 1
+
+
+def test_pickled_disk_entry_is_never_loaded(tmp_path):
+    class Exploit:
+        def __reduce__(self):
+            return os.system, (f"touch {tmp_path / 'pwned'}",)
+
+    cache = ResultCache(disk_dir=str(tmp_path))
+    key = ResultCache.make_key(b"frame", "cv", {})
+    path = cache._disk_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(pickle.dumps(Exploit()))
+
+    assert cache.get(key) is None
+    assert not (tmp_path / "pwned").exists()
+    # the unreadable entry is dropped
+    assert not os.path.exists(path)
+
+
+def test_uncacheable_value_is_skipped():
+    cache = ResultCache()
+    cache.put("key", {"status": 200, "value": object()})
+    assert cache.get("key") is None
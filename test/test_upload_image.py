@@ -0,0 +1,58 @@
+"""BlobUploadService error mapping and limits, on the local file backend."""
+import asyncio
+
+import pytest
+
+from upload_image import BlobUploadService, LocalBlobBackend
+
+
+async def body(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.fixture
+def service(tmp_path):
+    return BlobUploadService(LocalBlobBackend(str(tmp_path)), max_concurrency=1, max_stream_concurrency=1)
+
+
+def test_bad_base64_stream_raises_value_error(service, tmp_path):
+    with pytest.raises(ValueError):
+        asyncio.run(service.upload_stream(body(b"aGVsbG8gd29y", b"!!!!"), "png", base64_encoded=True))
+    # the partial file was removed
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_base64_stream_is_decoded(service, tmp_path):
+    url, size = asyncio.run(service.upload_stream(body(b"data:image/png;base64,aGVs", b"bG8="), "png",
+                                                  base64_encoded=True, blob_name="frame"))
+    assert size == 5
+    assert (tmp_path / "frame.png").read_bytes() == b"hello"
+
+
+def test_slow_stream_does_not_block_other_uploads(service):
+    async def run():
+        release = asyncio.Event()
+
+        async def slow_body():
+            yield b"first"
+            await release.wait()
+            yield b"rest"
+
+        stream = asyncio.ensure_future(service.upload_stream(slow_body(), "png"))
+        await asyncio.sleep(0.05)
+        # the stream holds its own slot, in-memory uploads still go through
+        url = await asyncio.wait_for(service.upload_bytes(b"frame", "jpeg"), timeout=1)
+        release.set()
+        _, size = await stream
+        return url, size
+
+    url, size = asyncio.run(run())
+    assert url.endswith(".jpeg")
+    assert size == len(b"firstrest")
+
+
+def test_bad_base64_string_raises_value_error(service, tmp_path):
+    with pytest.raises(ValueError):
+        asyncio.run(service.upload_base64("abc!", "png"))
+    assert list(tmp_path.iterdir()) == []
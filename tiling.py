@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import numpy
+
+from model_registry import model_registry
+from postprocess import nms
+
+
+def _positions(length: int, tile_size: int, stride: int) -> List[int]:
+    if length <= tile_size:
+        return [0]
+    positions = list(range(0, length - tile_size, stride))
+    # the last tile is aligned to the edge so the whole frame is covered
+    positions.append(length - tile_size)
+    return positions
+
+
+def tile_grid(width: int, height: int, tile_size: int = 640, overlap: float = 0.2) -> List[Tuple[int, int, int, int]]:
+    """
+    Splits a frame into overlapping tiles.
+    :return: List of (x_min, y_min, x_max, y_max) pixel windows.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError("tile_overlap must be in [0, 1)")
+    stride = max(1, int(tile_size * (1 - overlap)))
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in _positions(height, tile_size, stride)
+        for x in _positions(width, tile_size, stride)
+    ]
+
+
+def detect_tiled(image, model_name: str = None, tile_size: int = 640, overlap: float = 0.2,
+                 workers: int = 1, conf: float = 0.3, merge_iou: float = 0.5):
+    """
+    Sliced inference for frames much larger than the model input.
+
+    The tiles are sent to the model as one batch (split into `workers` batches run
+    concurrently). Boxes are shifted back into full-frame pixels and merged across
+    tiles with NMS. PyTorch models serialize forward passes on the model lock, so
+    extra workers mainly overlap slicing and merging with inference.
+
+    :return: (boxes, confidences, classes, tile_stats) with boxes in full-frame pixels.
+    """
+    height, width = image.shape[:2]
+    windows = tile_grid(width, height, tile_size, overlap)
+    # tiles are views into the frame, nothing is copied here
+    tiles = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in windows]
+
+    model = model_registry.get(model_name)
+    workers = max(1, min(workers, len(tiles)))
+    chunks = [list(range(i, len(tiles), workers)) for i in range(workers)]
+
+    def run_chunk(indices):
+        start = time.perf_counter()
+        results = model.predict([tiles[i] for i in indices], conf=conf, verbose=False)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return indices, results, elapsed_ms
+
+    if workers == 1:
+        outputs = [run_chunk(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(run_chunk, chunks))
+
+    all_boxes, all_conf, all_cls = [], [], []
+    tile_stats = [None] * len(tiles)
+    for indices, results, elapsed_ms in outputs:
+        for index, result in zip(indices, results):
+            x0, y0, x1, y1 = windows[index]
+            detections = result.boxes
+            boxes = detections.xyxy.cpu().numpy().astype(numpy.float64)
+            boxes += (x0, y0, x0, y0)
+            all_boxes.append(boxes)
+            all_conf.append(detections.conf.cpu().numpy())
+            all_cls.append(detections.cls.cpu().numpy() if detections.cls is not None
+                           else numpy.zeros(len(boxes)))
+
+            speed = getattr(result, "speed", None)
+            tile_stats[index] = {
+                "x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0,
+                "detections": len(boxes),
+                "ms": round(sum(speed.values()) if speed else elapsed_ms / len(indices), 2),
+            }
+
+    boxes = numpy.concatenate(all_boxes) if all_boxes else numpy.empty((0, 4))
+    confidences = numpy.concatenate(all_conf) if all_conf else numpy.empty(0)
+    classes = numpy.concatenate(all_cls) if all_cls else numpy.empty(0)
+
+    # flowers on tile borders are found twice, keep the most confident box
+    keep = nms(boxes, confidences, merge_iou)
+    return boxes[keep], confidences[keep], classes[keep], tile_stats
@@ -0,0 +1,105 @@
+"""
+Exports the trained flower model for the CPU inference backends.
+
+    python train-yolo-model/export-model.py --weights YOLOv8-str-flower-model.pt
+    python train-yolo-model/export-model.py --int8 --calibration-dir dataset/valid/images
+    python train-yolo-model/export-model.py --openvino
+
+Produces YOLOv8-str-flower-model.onnx (plus .int8.onnx with --int8) next to the
+weights; serve it with YOLO_MODELS=default=YOLOv8-str-flower-model.onnx.
+Export needs `pip install onnx onnxslim` on top of requirements.txt, and
+--openvino needs `pip install openvino`.
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from inference_backends import letterbox, to_blob  # noqa: E402
+
+
+class FolderCalibrationReader:
+    """Feeds letterboxed images from a folder to the ONNX Runtime static quantizer."""
+
+    def __init__(self, input_name: str, folder: str, imgsz: int, limit: int):
+        paths = sorted(glob.glob(os.path.join(folder, "*.jpg")) + glob.glob(os.path.join(folder, "*.png")))[:limit]
+        if not paths:
+            raise SystemExit(f"No .jpg/.png calibration images in {folder}")
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self.paths = iter(paths)
+
+    def get_next(self):
+        for path in self.paths:
+            image = cv2.imread(path)
+            if image is not None:
+                return {self.input_name: to_blob([letterbox(image, self.imgsz)[0]])}
+        return None
+
+
+def detect_head_nodes(graph) -> list:
+    """
+    Nodes of the Detect head (the last "/model.N/" block) plus the output node.
+    The head concatenates pixel boxes (0-640) with class scores (0-1) into one tensor,
+    and a shared uint8 scale for both would flatten every score to zero.
+    """
+    indices = [int(match.group(1)) for node in graph.node if (match := re.match(r"/model\.(\d+)/", node.name))]
+    head = f"/model.{max(indices)}/" if indices else None
+    outputs = {output.name for output in graph.output}
+    return [node.name for node in graph.node
+            if (head and node.name.startswith(head)) or outputs.intersection(node.output)]
+
+
+def quantize(onnx_path: str, output_path: str, imgsz: int, calibration_dir: str = None, limit: int = 200):
+    """
+    INT8-quantizes the exported graph. With calibration images the activations are
+    quantized statically (QDQ), which is what makes convolutions faster on CPU;
+    without them only the weights are quantized dynamically. The Detect head stays float.
+    """
+    import onnx
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    graph = onnx.load(onnx_path, load_external_data=False).graph
+    exclude = detect_head_nodes(graph)
+    if calibration_dir:
+        reader = FolderCalibrationReader(graph.input[0].name, calibration_dir, imgsz, limit)
+        quantize_static(onnx_path, output_path, reader, quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, nodes_to_exclude=exclude)
+    else:
+        quantize_dynamic(onnx_path, output_path, weight_type=QuantType.QUInt8, nodes_to_exclude=exclude)
+    print(f"Wrote {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="YOLOv8-str-flower-model.pt")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--dynamic", action="store_true", help="Dynamic batch size (lets the scheduler batch frames)")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--int8", action="store_true", help="Also write an INT8-quantized copy")
+    parser.add_argument("--calibration-dir", help="Images for static INT8 calibration")
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--openvino", action="store_true", help="Also export an OpenVINO IR")
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+
+    model = YOLO(args.weights)
+    onnx_path = model.export(format="onnx", imgsz=args.imgsz, dynamic=args.dynamic, simplify=True, opset=args.opset)
+    print(f"Wrote {onnx_path}")
+
+    if args.int8:
+        quantize(onnx_path, os.path.splitext(onnx_path)[0] + ".int8.onnx", args.imgsz,
+                 args.calibration_dir, args.calibration_images)
+
+    if args.openvino:
+        print(f"Wrote {model.export(format='openvino', imgsz=args.imgsz, dynamic=args.dynamic)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,368 @@
+import asyncio
 import base64
-from azure.storage.blob import BlobServiceClient
-from dotenv import load_dotenv
+import hashlib
+import logging
 import os
+import pathlib
 import uuid
+import re
+from typing import AsyncIterator, List, Optional
 
-# Load environment variables
-load_dotenv()
+import config  # noqa: F401  (loads .env)
+from metrics import blob_call_seconds, blob_upload_bytes
 
 # Azure Blob Storage Configuration
 CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 CONTAINER_NAME = os.getenv("AZURE_STORAGE_CONTAINER_NAME")
 
-# Initialize Blob Service Client
-blob_service_client = BlobServiceClient.from_connection_string(CONNECTION_STRING)
-container_client = blob_service_client.get_container_client(CONTAINER_NAME)
+# extensions end up in blob names and local file paths, so no dots or slashes
+_FILE_EXTENSION = re.compile(r"[A-Za-z0-9]+")
 
-def upload_base64_image(base64_string: str, file_extension: str = "png") -> str:
-    """Decodes a base64 string, uploads it as an image to Azure Blob Storage, and returns the blob URL."""
-    try:
-        # Decode base64 string to binary data
-        image_data = base64.b64decode(base64_string)
 
-        # Generate a unique file name
-        file_name = f"{uuid.uuid4()}.{file_extension}"
+def check_file_extension(file_extension: str) -> str:
+    """:raises ValueError: When the extension isn't plain letters and digits (e.g. "../x")."""
+    if not isinstance(file_extension, str) or not _FILE_EXTENSION.fullmatch(file_extension):
+        raise ValueError(f"Invalid file extension '{file_extension}', use letters and digits only")
+    return file_extension
 
-        # Get blob client
-        blob_client = container_client.get_blob_client(file_name)
 
-        # Upload the image data to Azure Blob Storage
-        blob_client.upload_blob(image_data, overwrite=True)
+class IncrementalBase64Decoder:
+    """
+    Decodes a base64 stream chunk by chunk, keeping at most 3 undecoded characters.
+    An optional leading "data:image/...;base64," prefix and any whitespace are skipped.
+    """
 
-        # Generate and return the blob URL
-        blob_url = blob_client.url
-        return blob_url
-    except Exception as e:
-        raise RuntimeError(f"Failed to upload image: {e}")
+    _whitespace = re.compile(rb"\s+")
+
+    def __init__(self):
+        self._pending = b""
+        self._prefix_checked = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self._pending + self._whitespace.sub(b"", chunk)
+        if not self._prefix_checked:
+            if data.startswith(b"data:"):
+                comma = data.find(b",")
+                if comma < 0:
+                    # prefix not complete yet, wait for more input
+                    self._pending = data
+                    return b""
+                data = data[comma + 1:]
+            elif len(data) < 5 and b"data:".startswith(data):
+                self._pending = data
+                return b""
+            self._prefix_checked = True
+
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return base64.b64decode(data[:usable], validate=True)
+
+    def finish(self) -> bytes:
+        if not self._pending:
+            return b""
+        pending, self._pending = self._pending, b""
+        if not self._prefix_checked:
+            raise ValueError("Incomplete base64 input")
+        return base64.b64decode(pending + b"=" * (-len(pending) % 4), validate=True)
+
+
+async def decode_base64_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Wraps a stream of base64 text chunks into a stream of decoded bytes."""
+    decoder = IncrementalBase64Decoder()
+    async for chunk in chunks:
+        decoded = decoder.feed(chunk)
+        if decoded:
+            yield decoded
+    tail = decoder.finish()
+    if tail:
+        yield tail
+
+
+class LocalBlobBackend:
+    """Stores blobs as files under a directory; used for offline runs and tests."""
+
+    def __init__(self, directory: str, base_url: Optional[str] = None):
+        self.directory = pathlib.Path(directory).resolve()
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    def _path(self, file_name: str) -> pathlib.Path:
+        path = (self.directory / file_name).resolve()
+        if self.directory not in path.parents:
+            raise ValueError(f"Invalid blob name '{file_name}'")
+        return path
+
+    async def url(self, file_name: str) -> str:
+        if self.base_url:
+            return f"{self.base_url}/{file_name}"
+        return self._path(file_name).as_uri()
+
+    async def exists(self, file_name: str) -> bool:
+        return self._path(file_name).exists()
+
+    async def upload(self, file_name: str, data: bytes) -> str:
+        path = self._path(file_name)
+
+        def write():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+
+        await asyncio.to_thread(write)
+        return await self.url(file_name)
+
+    async def upload_stream(self, file_name: str, chunks: AsyncIterator[bytes]) -> int:
+        path = self._path(file_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    await asyncio.to_thread(f.write, chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        return size
+
+    async def close(self):
+        pass
+
+
+class AzureBlobBackend:
+    """
+    Async Azure Blob Storage backend (also works against Azurite).
+
+    One client, and therefore one HTTP transport, is shared by every upload.
+    Payloads above max_single_put_size are sent as parallel staged blocks.
+    """
+
+    def __init__(self, connection_string: str, container_name: str, block_size: int = 4 * 1024 * 1024,
+                 max_single_put_size: int = 8 * 1024 * 1024, block_concurrency: int = 4):
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self.block_size = block_size
+        self.max_single_put_size = max_single_put_size
+        self.block_concurrency = block_concurrency
+        self._client = None
+        self._container = None
+        self._lock = asyncio.Lock()
+
+    async def _container_client(self):
+        if self._container is None:
+            async with self._lock:
+                if self._container is None:
+                    if not self.connection_string:
+                        raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING is not set")
+                    from azure.core.exceptions import ResourceExistsError
+                    from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+
+                    self._client = AsyncBlobServiceClient.from_connection_string(
+                        self.connection_string,
+                        max_block_size=self.block_size,
+                        max_single_put_size=self.max_single_put_size,
+                    )
+                    container = self._client.get_container_client(self.container_name)
+                    try:
+                        await container.create_container()
+                    except ResourceExistsError:
+                        pass
+                    self._container = container
+        return self._container
+
+    async def url(self, file_name: str) -> str:
+        container = await self._container_client()
+        return container.get_blob_client(file_name).url
+
+    async def exists(self, file_name: str) -> bool:
+        container = await self._container_client()
+        return await container.get_blob_client(file_name).exists()
+
+    async def upload(self, file_name: str, data: bytes) -> str:
+        container = await self._container_client()
+        blob_client = container.get_blob_client(file_name)
+        await blob_client.upload_blob(data, overwrite=True, max_concurrency=self.block_concurrency)
+        return blob_client.url
+
+    async def upload_stream(self, file_name: str, chunks: AsyncIterator[bytes]) -> int:
+        """
+        Stages the stream as blocks of block_size and commits them at the end, so at most
+        block_concurrency blocks are held in memory regardless of the image size.
+        """
+        container = await self._container_client()
+        blob_client = container.get_blob_client(file_name)
+        block_ids: List[str] = []
+        in_flight = set()
+        buffer = bytearray()
+        size = 0
+
+        async def stage(data: bytes):
+            block_id = base64.b64encode(f"{len(block_ids):08d}".encode()).decode()
+            block_ids.append(block_id)
+            in_flight.add(asyncio.ensure_future(blob_client.stage_block(block_id, data)))
+            if len(in_flight) >= self.block_concurrency:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                in_flight.difference_update(done)
+                for task in done:
+                    task.result()
+
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                buffer.extend(chunk)
+                while len(buffer) >= self.block_size:
+                    await stage(bytes(buffer[:self.block_size]))
+                    del buffer[:self.block_size]
+            if not block_ids:
+                # small (or empty) images fit in a single put
+                await blob_client.upload_blob(bytes(buffer), overwrite=True)
+                return size
+            if buffer:
+                await stage(bytes(buffer))
+            await asyncio.gather(*in_flight)
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            raise
+
+        await blob_client.commit_block_list(block_ids)
+        return size
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._container = None
+
+
+class BlobUploadService:
+    """
+    Non-blocking image uploads with bounded parallelism.
+
+    With deduplicate=True (and no explicit blob name) blobs are named after the
+    SHA-256 of their content, and an upload is skipped when that blob already exists.
+
+    Streamed uploads are paced by the client sending them, so they have their own
+    limit (max_stream_concurrency) and slow senders can't hold up in-memory uploads
+    such as the migration's.
+    """
+
+    def __init__(self, backend, max_concurrency: int = 8, deduplicate: bool = False, max_stream_concurrency: int = 8):
+        self.backend = backend
+        self.deduplicate = deduplicate
+        self.max_concurrency = max_concurrency
+        self.max_stream_concurrency = max_stream_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stream_semaphore: Optional[asyncio.Semaphore] = None
+        self.uploads = 0
+        self.deduplicated = 0
+
+    @classmethod
+    def from_env(cls) -> "BlobUploadService":
+        if os.getenv("BLOB_BACKEND", "azure") == "local":
+            backend = LocalBlobBackend(os.getenv("BLOB_LOCAL_DIR", "blob_storage"), os.getenv("BLOB_LOCAL_BASE_URL"))
+        else:
+            backend = AzureBlobBackend(
+                CONNECTION_STRING, CONTAINER_NAME,
+                block_size=int(float(os.getenv("BLOB_BLOCK_SIZE_MB", "4")) * 1024 * 1024),
+                block_concurrency=int(os.getenv("BLOB_BLOCK_CONCURRENCY", "4")),
+            )
+        return cls(
+            backend,
+            max_concurrency=int(os.getenv("BLOB_MAX_CONCURRENCY", "8")),
+            deduplicate=os.getenv("BLOB_DEDUPLICATE", "false").lower() == "true",
+            max_stream_concurrency=int(os.getenv("BLOB_STREAM_CONCURRENCY", "8")),
+        )
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # created on first use so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @property
+    def stream_semaphore(self) -> asyncio.Semaphore:
+        if self._stream_semaphore is None:
+            self._stream_semaphore = asyncio.Semaphore(self.max_stream_concurrency)
+        return self._stream_semaphore
+
+    async def upload_bytes(self, data: bytes, file_extension: str = "png", blob_name: Optional[str] = None,
+                           deduplicate: Optional[bool] = None, sha256: Optional[str] = None) -> str:
+        """
+        Uploads image bytes and returns the blob URL.
+        :param sha256: Hex digest of data when the caller already has it (deduplicated uploads only).
+        """
+        check_file_extension(file_extension)
+        deduplicate = self.deduplicate if deduplicate is None else deduplicate
+        backend = type(self.backend).__name__
+        try:
+            async with self.semaphore:
+                if blob_name is None and deduplicate:
+                    file_name = f"{sha256 or hashlib.sha256(data).hexdigest()}.{file_extension}"
+                    with blob_call_seconds.time(backend=backend, operation="exists"):
+                        exists = await self.backend.exists(file_name)
+                    if exists:
+                        self.deduplicated += 1
+                        return await self.backend.url(file_name)
+                else:
+                    file_name = f"{blob_name or uuid.uuid4()}.{file_extension}"
+
+                with blob_call_seconds.time(backend=backend, operation="upload"):
+                    url = await self.backend.upload(file_name, data)
+                self.uploads += 1
+                blob_upload_bytes.inc(len(data), backend=backend)
+                return url
+        except Exception as e:
+            raise RuntimeError(f"Failed to upload image: {e}")
+
+    async def upload_base64(self, base64_string: str, file_extension: str = "png",
+                            blob_name: Optional[str] = None, deduplicate: Optional[bool] = None) -> str:
+        """
+        Decodes a base64 string and uploads it like upload_bytes.
+        :raises ValueError: When the string isn't valid base64 (binascii.Error), the caller's fault.
+        """
+        check_file_extension(file_extension)
+        image_data = await asyncio.to_thread(base64.b64decode, base64_string)
+        return await self.upload_bytes(image_data, file_extension, blob_name, deduplicate)
+
+    async def upload_stream(self, chunks: AsyncIterator[bytes], file_extension: str = "png",
+                            base64_encoded: bool = False, blob_name: Optional[str] = None):
+        """
+        Pipes a stream of chunks to blob storage without holding the whole image.
+        :return: (blob URL, uploaded size in bytes).
+        """
+        file_name = f"{blob_name or uuid.uuid4()}.{check_file_extension(file_extension)}"
+        if base64_encoded:
+            chunks = decode_base64_stream(chunks)
+        try:
+            async with self.stream_semaphore:
+                backend = type(self.backend).__name__
+                with blob_call_seconds.time(backend=backend, operation="upload_stream"):
+                    size = await self.backend.upload_stream(file_name, chunks)
+                self.uploads += 1
+                blob_upload_bytes.inc(size, backend=backend)
+                return await self.backend.url(file_name), size
+        except ValueError:
+            # the client's fault (bad base64, incomplete input), not a storage error
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to upload image: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "max_concurrency": self.max_concurrency,
+            "max_stream_concurrency": self.max_stream_concurrency,
+            "uploads": self.uploads,
+            "deduplicated": self.deduplicated,
+        }
+
+    async def close(self):
+        await self.backend.close()
+        logging.info("Closed blob upload service")
+
+
+blob_service = BlobUploadService.from_env()
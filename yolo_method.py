@@ -1,47 +1,206 @@
-from ultralytics import YOLO
 import cv2
-import numpy
 import base64
-import os
-from datetime import datetime
+from typing import List, Optional
 
-def find_flower_yolo(b64img: str) -> dict:
+from inference_scheduler import inference_scheduler
+from metrics import stage_timer
+from model_registry import model_registry
+from postprocess import postprocess_boxes
+from preprocess import YOLO_INPUT_SIZE, decode_for_size, reduced_decode_side, to_original
+from tiling import detect_tiled
+
+# response formats accepted by the detection routes
+OUTPUT_FORMATS = ("png", "jpeg", "coords", "binary")
+
+def find_flower_yolo(b64img: str, model_name: str = None, output: str = "png", quality: int = 90, **options) -> dict:
     """
     :param b64img: Base64 encoded image string (image string part only).
+    :param model_name: Registered model version to use (default model when None).
+    :param output: Response format, one of OUTPUT_FORMATS (see render_detections).
+    :param quality: JPEG quality for the "jpeg" and "binary" formats.
+    :param options: Post-processing options forwarded to detect_flowers_yolo.
     :return: A response JSON with processed image and coordinates.
     """
 
-    # sorting key
-    sort_key = "y"
-    # note to Rusira: use "x" or "y" to coordinates sort by x-axis or y-axis
-
     # decode the Base64 image
-    image_array = numpy.frombuffer(base64.b64decode(b64img), numpy.uint8)
-    image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+    with stage_timer("yolo", "imdecode"):
+        image, factor, size = decode_for_size(base64.b64decode(b64img), _decode_side(output, options))
 
     if image is None:
         raise ValueError("Failed to decode image from Base64 input. Check input, don't send this part 'data:image/png;base64,'.")
 
-    if not os.path.exists("YOLOv8-str-flower-model.pt"):
-        raise FileNotFoundError("Model file not found")
+    return detect_flowers_yolo(image, model_name, output, quality, decode_factor=factor, original_size=size, **options)
+
+
+def find_flower_yolo_bytes(data: bytes, model_name: str = None, output: str = "png", quality: int = 90, **options) -> dict:
+    """
+    :param data: Raw encoded image bytes (PNG, JPEG, ...), e.g. a multipart or octet-stream body.
+    :param model_name: Registered model version to use (default model when None).
+    :param output: Response format, one of OUTPUT_FORMATS (see render_detections).
+    :param quality: JPEG quality for the "jpeg" and "binary" formats.
+    :param options: Post-processing options forwarded to detect_flowers_yolo.
+    :return: A response JSON with processed image and coordinates.
+    """
+
+    # decode directly from the request buffer, no base64 round trip
+    with stage_timer("yolo", "imdecode"):
+        image, factor, size = decode_for_size(data, _decode_side(output, options))
+
+    if image is None:
+        raise ValueError("Failed to decode image from request body.")
+
+    return detect_flowers_yolo(image, model_name, output, quality, decode_factor=factor, original_size=size, **options)
+
+
+def _decode_side(output: str, options: dict) -> int:
+    # tiling and the cascade crop regions out of the full-resolution frame
+    if options.get("tiled") or options.get("cascade"):
+        return 0
+    return reduced_decode_side(YOLO_INPUT_SIZE, full_frame_output=output != "coords")
+
+
+def detect_flowers_yolo(image, model_name: str = None, output: str = "png", quality: int = 90,
+                        sort_key: str = "y", min_conf: float = 0.0, top_k: int = None,
+                        classes: list = None, iou: float = None, tiled: bool = False,
+                        tile_size: int = 640, tile_overlap: float = 0.2, tile_workers: int = 1,
+                        cascade: bool = False, decode_factor: int = 1, original_size=None) -> dict:
+    """
+    :param image: Decoded BGR image.
+    :param model_name: Registered model version to use (default model when None).
+    :param output: Response format, one of OUTPUT_FORMATS (see render_detections).
+    :param quality: JPEG quality for the "jpeg" and "binary" formats.
+    :param sort_key: Sort coordinates by "x", "y" or "confidence".
+    :param min_conf: Drop detections below this confidence (the model itself runs at 0.3).
+    :param top_k: Keep only the k most confident detections.
+    :param classes: Keep only these class ids.
+    :param iou: Extra NMS IoU threshold applied after the model's own NMS.
+    :param tiled: Run sliced inference over overlapping tiles (for frames much larger than 640px).
+    :param tile_size: Tile edge in pixels.
+    :param tile_overlap: Fraction of overlap between neighbouring tiles.
+    :param tile_workers: Number of tile batches run concurrently.
+    :param cascade: Run the HSV pass first and skip YOLO or run it on candidate regions only.
+    :param decode_factor: Original pixels per image pixel when the frame was decoded reduced (see decode_for_size).
+    :param original_size: (width, height) of the original frame, the image size when None.
+    :return: A response JSON with processed image and coordinates.
+    """
+
+    tile_stats = None
+    cascade_info = None
+    if cascade:
+        # imported here because the cascade module builds on this one
+        from cascade import cascade_detector
+        with stage_timer("yolo", "inference"):
+            raw_boxes, raw_conf, raw_cls, cascade_info = cascade_detector.detect(image, model_name, conf=0.3)
+    elif tiled:
+        # slice, run all tiles as a batch and merge back into full-frame pixels
+        with stage_timer("yolo", "inference"):
+            raw_boxes, raw_conf, raw_cls, tile_stats = detect_tiled(
+                image, model_name, tile_size=tile_size, overlap=tile_overlap, workers=tile_workers, conf=0.3
+            )
+    else:
+        # run inference and find flowers (batched with concurrent requests by the scheduler)
+        with stage_timer("yolo", "inference"):
+            results = inference_scheduler.predict(image, model_name, conf=0.3)
+        raw_boxes, raw_conf, raw_cls = raw_detections(results[0])
+
+    response = build_response(image, raw_boxes, raw_conf, raw_cls, output, quality,
+                              sort_key=sort_key, min_conf=min_conf, top_k=top_k, classes=classes, iou=iou,
+                              decode_factor=decode_factor, original_size=original_size)
+    if tile_stats is not None:
+        response["tiles"] = tile_stats
+    if cascade_info is not None:
+        response["cascade"] = cascade_info
+    return response
+
+
+def find_flower_yolo_batch(images_data: List[Optional[bytes]], model_name: str = None, output: str = "png",
+                           quality: int = 90, **options) -> List[dict]:
+    """
+    :param images_data: Raw encoded image bytes per frame (None for frames that could not be read).
+    :param model_name: Registered model version to use (default model when None).
+    :param output: Response format, "png", "jpeg" or "coords" ("binary" can't be batched).
+    :param quality: JPEG quality for the "jpeg" format.
+    :param options: Post-processing options, as for detect_flowers_yolo.
+    :return: One response per frame, in input order. Frames that fail get
+             {"status": 400, "error": ...} without affecting the others.
+    """
+    if output == "binary":
+        raise ValueError("format=binary is not supported for batches, use png, jpeg or coords")
+
+    responses: List[Optional[dict]] = [None] * len(images_data)
+
+    if options.get("tiled") or options.get("cascade"):
+        # tiled and cascade frames are already batched region by region
+        for index, data in enumerate(images_data):
+            try:
+                if data is None:
+                    raise ValueError("Failed to decode image from Base64 input.")
+                responses[index] = find_flower_yolo_bytes(data, model_name, output, quality, **options)
+            except Exception as e:
+                responses[index] = {"status": 400, "error": str(e)}
+        return responses
+
+    images = {}
+    decode_side = _decode_side(output, options)
+    for index, data in enumerate(images_data):
+        with stage_timer("yolo", "imdecode"):
+            image, factor, size = decode_for_size(data, decode_side) if data else (None, 1, None)
+        if image is None:
+            responses[index] = {"status": 400, "error": "Failed to decode image."}
+        else:
+            images[index] = (image, factor, size)
+
+    if images:
+        # one forward pass for every frame that decoded
+        model = model_registry.get(model_name)
+        with stage_timer("yolo", "inference"):
+            results = model.predict([image for image, _, _ in images.values()], conf=0.3, verbose=False)
 
-    # load the YOLO model
-    model = YOLO("YOLOv8-str-flower-model.pt")
+        for (index, (image, factor, size)), result in zip(images.items(), results):
+            try:
+                raw_boxes, raw_conf, raw_cls = raw_detections(result)
+                responses[index] = build_response(image, raw_boxes, raw_conf, raw_cls, output, quality,
+                                                  decode_factor=factor, original_size=size, **options)
+            except Exception as e:
+                responses[index] = {"status": 400, "error": str(e)}
 
-    # run inference and find flowers
-    results = model(image, conf=0.3)
+    return responses
+
+
+def raw_detections(result):
+    """:return: (boxes, confidences, classes) NumPy arrays of one ultralytics result."""
+    detections = result.boxes
+    raw_boxes = detections.xyxy.cpu().numpy()
+    raw_conf = detections.conf.cpu().numpy()
+    raw_cls = detections.cls.cpu().numpy() if detections.cls is not None else None
+    return raw_boxes, raw_conf, raw_cls
+
+
+def build_response(image, raw_boxes, raw_conf, raw_cls, output: str = "png", quality: int = 90,
+                   sort_key: str = "y", min_conf: float = 0.0, top_k: int = None,
+                   classes: list = None, iou: float = None, decode_factor: int = 1, original_size=None,
+                   **_) -> dict:
+    """
+    Post-processes raw model boxes for one frame and renders the requested response.
+    Coordinates are normalized by original_size (the image size when None), with the
+    boxes scaled up by decode_factor first for frames decoded at reduced resolution.
+    """
 
-    # extract bounding boxes and normalize coordinates
+    # extract bounding boxes, normalize, filter and sort coordinates as array operations
     height, width, _ = image.shape
-    normalized_coords = []
+    width, height = original_size or (width, height)
+    boxes, confidences, normalized_coords = postprocess_boxes(
+        to_original(raw_boxes, decode_factor, (width, height)), raw_conf, raw_cls, width, height,
+        sort_key=sort_key, min_conf=min_conf, top_k=top_k, class_ids=classes, iou=iou,
+    )
 
-    for box, conf in zip(results[0].boxes.xyxy.cpu().numpy(), results[0].boxes.conf.cpu().numpy()):
+    return render_detections(image, boxes / decode_factor, confidences, normalized_coords, output, quality)
+
+
+def draw_detections(image, boxes, confidences):
+    """Draws bounding boxes and confidence scores onto the image in place."""
+    for box, conf in zip(boxes, confidences):
         x_min, y_min, x_max, y_max = map(float, box)
-        normalized_coords.append({
-            "x": round((x_min + x_max) / 2 / width, 4),
-            "y": round((y_min + y_max) / 2 / height, 4),
-            "confidence": round(float(conf), 2),
-        })
 
         # draw bounding boxes on the image
         cv2.rectangle(
@@ -62,16 +221,57 @@ def find_flower_yolo(b64img: str) -> dict:
             1, cv2.LINE_AA
         )
 
-    # sorting
-    normalized_coords.sort(key=lambda coord: coord[sort_key])
 
-    # convert processed image to Base64
-    _, buffer = cv2.imencode(".png", image)
-    result_base64 = base64.b64encode(buffer).decode("utf-8")
+def render_detections(image, boxes, confidences, normalized_coords: list,
+                      output: str = "png", quality: int = 90, pipeline: str = "yolo",
+                      draw=draw_detections) -> dict:
+    """
+    Builds the response for the requested output format.
+
+    "coords" skips drawing and encoding entirely, "png" keeps the original response,
+    "jpeg" embeds an annotated JPEG at the given quality and "binary" returns the
+    annotated JPEG as raw bytes under "image_bytes" (the route sends them as the body).
+    `draw(image, boxes, confidences)` annotates the image in place and `pipeline`
+    labels the stage timings.
+    """
+    if output not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output}', use one of: {', '.join(OUTPUT_FORMATS)}")
+
+    if output == "coords":
+        return {"status": 200, "imageResult": normalized_coords}
+
+    with stage_timer(pipeline, "draw"):
+        draw(image, boxes, confidences)
+
+    if output == "png":
+        # convert processed image to Base64
+        with stage_timer(pipeline, "encode"):
+            _, buffer = cv2.imencode(".png", image)
+        with stage_timer(pipeline, "b64encode"):
+            result_base64 = base64.b64encode(buffer).decode("utf-8")
+
+        # return JSON
+        return {
+            "status": 200,
+            "image": f"data:image/png;base64,{result_base64}",
+            "imageResult": normalized_coords
+        }
+
+    with stage_timer(pipeline, "encode"):
+        _, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+    if output == "binary":
+        return {
+            "status": 200,
+            "image_bytes": buffer.tobytes(),
+            "media_type": "image/jpeg",
+            "imageResult": normalized_coords
+        }
 
-    # return JSON
+    with stage_timer(pipeline, "b64encode"):
+        result_base64 = base64.b64encode(buffer).decode("utf-8")
     return {
         "status": 200,
-        "image": f"data:image/png;base64,{result_base64}",
+        "image": f"data:image/jpeg;base64,{result_base64}",
         "imageResult": normalized_coords
     }